@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of the node server poll cycle
+
+Drives Controller.query_conditions, Controller.query_forecast and
+DailyNode.update_forecast against the recorded OpenWeatherMap responses
+in bench/fixtures (metric, as the node server queries them), using a
+fake polyinterface that counts setDriver calls and a fake HTTP session
+that serves the fixtures with an optional simulated latency.  Nothing
+goes to the network.
+
+For each combination of location count and forecast days it reports the
+time of a full poll cycle (conditions + forecast for every location),
+the time spent in each stage (http, decode, project, aggregate, et,
+publish), the
+requests and setDriver calls per cycle, and the memory allocated by a
+cycle.
+
+The fixtures are the same every cycle, so the publisher's deadbands would
+suppress every driver update after the first cycle and the publish stage
+would measure nothing.  By default what was last published is forgotten
+before each cycle (outside the timing) so every cycle publishes all its
+drivers, --unchanged keeps it to measure the suppressed path instead.
+The sent and suppressed updates per cycle are reported either way.  Stage times are summed over the fetch engine's worker threads,
+so with concurrent requests the http stage can exceed the cycle time.
+Results are written as one JSON object per line.
+
+usage:
+    python3 bench/bench_poll.py --locations 1,10,100 --days 0,5 --output results.jsonl
+    python3 bench/bench_poll.py --json json     # compare with the stdlib decoder
+    python3 bench/bench_poll.py --hourly-et     # ET summed from the forecast periods
+    python3 bench/bench_poll.py --unchanged     # updates suppressed by the deadbands
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import fake_polyinterface
+fake_polyinterface.install()
+
+from nodes import owm
+from nodes import aggregate
+from nodes import cache
+from nodes import et3
+from nodes import jsondecode
+from nodes import projection
+
+FIXTURES = os.path.join(HERE, 'fixtures')
+SCRATCH = tempfile.mkdtemp(prefix='bench_poll.')
+STAGES = ('http', 'decode', 'project', 'aggregate', 'et', 'publish')
+
+daily_forecast = aggregate.daily_forecast
+evapotranspriation = et3.evapotranspriation
+hourly_evapotranspiration_batch = et3.hourly_evapotranspiration_batch
+project = projection.project
+
+
+# Accumulates the time spent in each stage during a cycle.  Stages that
+# run in the fetch engine's worker threads are accumulated under a lock.
+class Stages:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.times = dict((s, 0.0) for s in STAGES)
+
+    def add(self, stage, elapsed):
+        with self.lock:
+            self.times[stage] += elapsed
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.content = body
+        self.status_code = 200
+        self.headers = {}
+        self.raw = None
+
+    def close(self):
+        pass
+
+
+# Serves the fixture for the endpoint in the request URL
+class FakeSession:
+    adapters = {}
+
+    def __init__(self, stages, latency):
+        self.stages = stages
+        self.latency = latency
+        self.requests = 0
+        self.bodies = {}
+        for name in os.listdir(FIXTURES):
+            if name.endswith('.json'):
+                with open(os.path.join(FIXTURES, name), 'rb') as f:
+                    self.bodies[name[:-5].replace('_', '/')] = f.read()
+
+    def get(self, url, timeout=None):
+        start = time.perf_counter()
+        endpoint = url.split('/data/2.5/', 1)[1].split('?', 1)[0]
+        if self.latency > 0:
+            time.sleep(self.latency)
+        self.requests += 1
+        response = FakeResponse(self.bodies[endpoint])
+        self.stages.add('http', time.perf_counter() - start)
+        return response
+
+    def close(self):
+        pass
+
+
+def make_controller(locations, days, stages, latency, hourly_et):
+    params = {
+            'APIkey': 'benchmark',
+            'Location': ';'.join(['zip=%05d,us' % (10000 + i) for i in range(locations)]),
+            # the fixtures are metric like the queries, the nodes convert
+            # them to imperial when they publish
+            'Units': 'imperial',
+            'Forecast Days': str(days),
+            'History Days': '0',
+            'Hourly ET': str(hourly_et).lower(),
+            }
+    poly = fake_polyinterface.Poly(params)
+    # stop() saves the snapshots, keep them away from a real warm start
+    # file in the current directory
+    owm.SNAPSHOT_FILE = os.path.join(SCRATCH, 'snapshot.json')
+    controller = owm.Controller(poly)
+    controller.check_params()
+    controller.discover()
+
+    # Every cycle should make its requests, no caching or rate limits
+    controller.cache = cache.ResponseCache(dict((e, 0) for e in cache.DEFAULT_TTL))
+    controller.fetcher.limiter = None
+    controller.fetcher.start()
+    controller.fetcher.session = FakeSession(stages, latency)
+    controller.publisher.flush = stages.wrap('publish', controller.publisher.flush)
+    jsondecode.loads = stages.wrap('decode', loads)
+    projection.project = stages.wrap('project', project)
+    aggregate.daily_forecast = stages.wrap('aggregate', daily_forecast)
+    et3.evapotranspriation = stages.wrap('et', evapotranspriation)
+    et3.hourly_evapotranspiration_batch = stages.wrap('et', hourly_evapotranspiration_batch)
+    return controller
+
+
+def run_cycle(controller):
+    for loc in controller.locations:
+        controller.poll_job(controller.query_conditions, False, loc)
+        controller.poll_job(controller.query_forecast, loc)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    idx = min(int(round(pct / 100.0 * (len(values) - 1))), len(values) - 1)
+    return values[idx]
+
+
+def bench(locations, days, iterations, latency, hourly_et=False, unchanged=False):
+    stages = Stages()
+    controller = make_controller(locations, days, stages, latency, hourly_et)
+    session = controller.fetcher.session
+
+    # first cycle resolves the coordinates
+    run_cycle(controller)
+
+    publisher = controller.publisher
+    cycles = []
+    stage_totals = dict((s, []) for s in STAGES)
+    requests = session.requests
+    drivers = fake_polyinterface.driver_calls['count']
+    sent = publisher.sent
+    suppressed = publisher.suppressed
+    for i in range(iterations):
+        stages.reset()
+        if not unchanged:
+            publisher.last.clear()
+        start = time.perf_counter()
+        run_cycle(controller)
+        cycles.append(time.perf_counter() - start)
+        for s in STAGES:
+            stage_totals[s].append(stages.times[s])
+    requests = (session.requests - requests) / float(iterations)
+    drivers = (fake_polyinterface.driver_calls['count'] - drivers) / float(iterations)
+    sent = (publisher.sent - sent) / float(iterations)
+    suppressed = (publisher.suppressed - suppressed) / float(iterations)
+
+    if not unchanged:
+        publisher.last.clear()
+    tracemalloc.start()
+    run_cycle(controller)
+    (current, peak) = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+
+    controller.stop()
+
+    ms = lambda v: round(v * 1000.0, 4)
+    return {
+            'json': jsondecode.BACKEND,
+            'locations': locations,
+            'forecast_days': days,
+            'hourly_et': hourly_et,
+            'unchanged': unchanged,
+            'iterations': iterations,
+            'latency_ms': ms(latency),
+            'cycle_ms': {
+                'mean': ms(statistics.mean(cycles)),
+                'p50': ms(percentile(cycles, 50)),
+                'p95': ms(percentile(cycles, 95)),
+                'max': ms(max(cycles)),
+                },
+            'stages_ms': dict((s, ms(statistics.mean(stage_totals[s]))) for s in STAGES),
+            'requests_per_cycle': requests,
+            'set_driver_per_cycle': drivers,
+            'sent_per_cycle': sent,
+            'suppressed_per_cycle': suppressed,
+            'memory': {
+                'peak_bytes': peak,
+                'retained_bytes': current,
+                'retained_blocks': blocks,
+                },
+            }
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',') if v.strip() != '']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline poll cycle benchmark')
+    parser.add_argument('--locations', type=int_list, default=[1, 10, 50],
+            help='comma separated list of location counts (default 1,10,50)')
+    parser.add_argument('--days', type=int_list, default=[0, 5],
+            help='comma separated list of forecast days (default 0,5)')
+    parser.add_argument('--iterations', type=int, default=20,
+            help='timed cycles per combination (default 20)')
+    parser.add_argument('--latency', type=float, default=0.0,
+            help='simulated HTTP latency in milliseconds (default 0)')
+    parser.add_argument('--json', default=None,
+            help='JSON backend to decode with, json, ujson or orjson (default: fastest installed)')
+    parser.add_argument('--hourly-et', action='store_true',
+            help='sum the ET of the 3 hour forecast periods (Hourly ET)')
+    parser.add_argument('--unchanged', action='store_true',
+            help="don't forget the published values between cycles, the deadbands suppress the updates")
+    parser.add_argument('--output', default=None,
+            help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--verbose', action='store_true',
+            help='show the node server log messages')
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    jsondecode.use(args.json)
+    loads = jsondecode.loads
+
+    out = sys.stdout if args.output is None else open(args.output, 'w')
+    for locations in args.locations:
+        for days in args.days:
+            result = bench(locations, days, args.iterations, args.latency / 1000.0,
+                    args.hourly_et, args.unchanged)
+            out.write(json.dumps(result, sort_keys=True) + '\n')
+            out.flush()
+            sys.stderr.write('%4d locations %d days: %9.3f ms/cycle  %s  sent=%d suppressed=%d\n' % (
+                locations, days, result['cycle_ms']['mean'],
+                ' '.join('%s=%.3f' % (s, result['stages_ms'][s]) for s in STAGES),
+                result['sent_per_cycle'], result['suppressed_per_cycle']))
+    if out is not sys.stdout:
+        out.close()
+    shutil.rmtree(SCRATCH, ignore_errors=True)
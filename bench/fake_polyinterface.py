@@ -0,0 +1,94 @@
+#
+#  Minimal stand-in for polyinterface used by the benchmarks
+#
+#  Just enough of the Controller/Node interface for the node server to
+#  run without Polyglot.  setDriver calls are counted instead of being
+#  sent anywhere.
+#
+#  install() must be called before any of the node server modules are
+#  imported.
+
+import logging
+import sys
+
+LOGGER = logging.getLogger('owm-bench')
+LOGGER.addHandler(logging.NullHandler())
+
+# setDriver calls made by all nodes
+driver_calls = {'count': 0}
+
+
+class Node:
+    def __init__(self, controller, primary, address, name):
+        self.controller = controller
+        self.parent = controller
+        self.primary = primary
+        self.address = address
+        self.name = name
+        self.poly = getattr(controller, 'poly', None)
+        if not hasattr(self, 'drivers'):
+            self.drivers = []
+
+    def setDriver(self, driver, value, report=True, force=False, uom=None):
+        driver_calls['count'] += 1
+        for d in self.drivers:
+            if d['driver'] == driver:
+                d['value'] = value
+                if uom is not None:
+                    d['uom'] = uom
+
+    def reportDrivers(self):
+        pass
+
+
+class Poly:
+    def __init__(self, params, short_poll=300, long_poll=600):
+        self.polyConfig = {
+                'customParams': params,
+                'customData': {},
+                'nodes': [],
+                'shortPoll': short_poll,
+                'longPoll': long_poll,
+                }
+
+    def onConfig(self, callback):
+        self.config_callback = callback
+
+    def installprofile(self):
+        return True
+
+    def saveCustomData(self, data):
+        self.polyConfig['customData'] = data
+
+
+class Controller(Node):
+    def __init__(self, poly):
+        self.poly = poly
+        self.polyConfig = poly.polyConfig
+        self.controller = self
+        self.nodes = {}
+        self.notices = {}
+        self.drivers = [dict(d) for d in type(self).drivers]
+
+    def addNode(self, node, update=False):
+        self.nodes[node.address] = node
+        return node
+
+    def delNode(self, address):
+        self.nodes.pop(address, None)
+
+    def addNotice(self, msg, key=None):
+        self.notices[key] = msg
+
+    def removeNotice(self, key):
+        self.notices.pop(key, None)
+
+    def removeNoticesAll(self):
+        self.notices = {}
+
+    def addCustomParam(self, params):
+        pass
+
+
+def install():
+    sys.modules['polyinterface'] = sys.modules[__name__]
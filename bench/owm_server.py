@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Local OpenWeatherMap stand-in server for load testing
+
+Serves the weather, uvi, forecast, uvi/forecast and onecall endpoints
+with the same JSON shapes as api.openweathermap.org.  Any location is accepted
+(zip=, q=, id= or lat=&lon=), the data for each one is synthetic but
+stable, derived from a hash of the location, so thousands of distinct
+locations can be simulated.  Temperatures and wind speeds follow the
+units parameter (standard, metric or imperial) like the real API.
+
+Upstream behaviour can be injected:
+    --latency / --jitter / --dist   response latency distribution
+    --error-rate                    fraction of 500/502/503 responses
+    --truncate-rate                 fraction of bodies cut off mid-way
+    --malformed-rate                fraction of bodies that aren't JSON
+    --throttle-rate                 fraction of random 429 responses
+    --calls-per-minute              429 with Retry-After above this rate
+
+Point the node server at it with the OWM_BASE_URL environment variable:
+
+    python3 bench/owm_server.py --port 8080 --latency 80 --dist lognormal
+    OWM_BASE_URL=http://127.0.0.1:8080/data/2.5/ python3 owm.py
+
+GET /stats returns the request counters as JSON.
+"""
+
+import argparse
+import collections
+import gzip
+import hashlib
+import http.server
+import json
+import math
+import random
+import threading
+import time
+import urllib.parse
+
+ENDPOINTS = ('weather', 'uvi', 'forecast', 'uvi/forecast', 'onecall')
+
+
+class Behaviour:
+    def __init__(self, args):
+        self.latency = args.latency / 1000.0
+        self.jitter = args.jitter / 1000.0
+        self.dist = args.dist
+        self.error_rate = args.error_rate
+        self.truncate_rate = args.truncate_rate
+        self.malformed_rate = args.malformed_rate
+        self.throttle_rate = args.throttle_rate
+        self.calls_per_minute = args.calls_per_minute
+        self.lock = threading.Lock()
+        self.calls = collections.deque()
+        self.stats = collections.Counter()
+        self.random = random.Random(args.seed)
+
+    def delay(self):
+        with self.lock:
+            r = self.random
+            if self.dist == 'uniform':
+                d = r.uniform(self.latency - self.jitter, self.latency + self.jitter)
+            elif self.dist == 'exponential':
+                d = r.expovariate(1.0 / self.latency) if self.latency > 0 else 0
+            elif self.dist == 'lognormal':
+                # median = latency, jitter sets the spread (sigma)
+                sigma = self.jitter / self.latency if self.latency > 0 else 0
+                d = self.latency * math.exp(r.gauss(0, sigma)) if self.latency > 0 else 0
+            else:
+                d = self.latency
+        return max(d, 0)
+
+    def chance(self, rate):
+        if rate <= 0:
+            return False
+        with self.lock:
+            return self.random.random() < rate
+
+    # True if the call is over the per minute quota
+    def over_quota(self):
+        if self.calls_per_minute <= 0:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            while len(self.calls) > 0 and self.calls[0] < now - 60:
+                self.calls.popleft()
+            if len(self.calls) >= self.calls_per_minute:
+                return True
+            self.calls.append(now)
+            return False
+
+    def count(self, what):
+        with self.lock:
+            self.stats[what] += 1
+
+
+# Stable pseudo random numbers for a location
+class Synth:
+    def __init__(self, location):
+        digest = hashlib.sha1(location.encode('utf-8')).digest()
+        self.random = random.Random(int.from_bytes(digest[:8], 'big'))
+
+    def uniform(self, lo, hi):
+        return self.random.uniform(lo, hi)
+
+
+def location_key(params):
+    for k in ('zip', 'q', 'id'):
+        if k in params:
+            return k + '=' + params[k]
+    if 'lat' in params and 'lon' in params:
+        return 'lat=%s&lon=%s' % (params['lat'], params['lon'])
+    return None
+
+
+def coordinates(params, key):
+    if 'lat' in params and 'lon' in params:
+        return (float(params['lat']), float(params['lon']))
+    s = Synth(key)
+    return (round(s.uniform(-60, 60), 2), round(s.uniform(-180, 180), 2))
+
+
+def convert_temp(c, units):
+    if units == 'imperial':
+        return round(c * 1.8 + 32, 2)
+    if units == 'metric':
+        return round(c, 2)
+    return round(c + 273.15, 2)
+
+
+def convert_speed(ms, units):
+    if units == 'imperial':
+        return round(ms * 2.23694, 2)
+    return round(ms, 2)
+
+
+def weather(params, key, now):
+    units = params.get('units', 'standard')
+    (lat, lon) = coordinates(params, key)
+    s = Synth(key)
+    base = s.uniform(-5, 30)
+    temp = base + 5 * math.sin((now % 86400) / 86400.0 * 2 * math.pi)
+    data = {
+            'coord': {'lon': lon, 'lat': lat},
+            'weather': [{'id': s.random.choice([800, 801, 802, 803, 804, 500, 501, 600]),
+                'main': 'Clouds', 'description': 'clouds', 'icon': '03d'}],
+            'base': 'stations',
+            'main': {
+                'temp': convert_temp(temp, units),
+                'feels_like': convert_temp(temp - 1, units),
+                'temp_min': convert_temp(temp - 2, units),
+                'temp_max': convert_temp(temp + 2, units),
+                'pressure': int(s.uniform(995, 1030)),
+                'humidity': int(s.uniform(20, 95)),
+                },
+            'visibility': 10000,
+            'wind': {
+                'speed': convert_speed(s.uniform(0, 10), units),
+                'deg': int(s.uniform(0, 360)),
+                'gust': convert_speed(s.uniform(5, 15), units),
+                },
+            'clouds': {'all': int(s.uniform(0, 100))},
+            # observations update every 10 minutes
+            'dt': int(now - now % 600),
+            'sys': {'country': 'US', 'sunrise': int(now - 20000), 'sunset': int(now + 20000)},
+            'timezone': 0,
+            'id': int(s.uniform(1000, 9999999)),
+            'name': key,
+            'cod': 200,
+            }
+    if s.uniform(0, 1) < 0.3:
+        data['rain'] = {'1h': round(s.uniform(0, 5), 2)}
+    return data
+
+
+def forecast(params, key, now):
+    units = params.get('units', 'standard')
+    (lat, lon) = coordinates(params, key)
+    s = Synth(key)
+    base = s.uniform(-5, 30)
+    start = int(now - now % 10800) + 10800
+    rows = []
+    for i in range(40):
+        dt = start + i * 10800
+        temp = base + 6 * math.sin((dt % 86400) / 86400.0 * 2 * math.pi)
+        row = {
+                'dt': dt,
+                'main': {
+                    'temp': convert_temp(temp, units),
+                    'feels_like': convert_temp(temp - 1, units),
+                    'temp_min': convert_temp(temp - 1, units),
+                    'temp_max': convert_temp(temp + 1, units),
+                    'pressure': int(s.uniform(995, 1030)),
+                    'sea_level': 1013,
+                    'grnd_level': 1000,
+                    'humidity': int(s.uniform(20, 95)),
+                    'temp_kf': 0,
+                    },
+                'weather': [{'id': s.random.choice([800, 801, 802, 803, 804, 500, 501, 600]),
+                    'main': 'Clouds', 'description': 'clouds', 'icon': '03d'}],
+                'clouds': {'all': int(s.uniform(0, 100))},
+                'wind': {'speed': convert_speed(s.uniform(0, 10), units), 'deg': int(s.uniform(0, 360))},
+                'visibility': 10000,
+                'pop': round(s.uniform(0, 1), 2),
+                'sys': {'pod': 'd'},
+                'dt_txt': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(dt)),
+                }
+        if s.uniform(0, 1) < 0.3:
+            row['rain'] = {'3h': round(s.uniform(0, 5), 2)}
+        rows.append(row)
+
+    return {
+            'cod': '200',
+            'message': 0,
+            'cnt': len(rows),
+            'list': rows,
+            'city': {'id': int(s.uniform(1000, 9999999)), 'name': key,
+                'coord': {'lat': lat, 'lon': lon}, 'country': 'US',
+                'timezone': 0, 'sunrise': int(now - 20000), 'sunset': int(now + 20000)},
+            }
+
+
+def uvi(params, key, now):
+    (lat, lon) = coordinates(params, key)
+    day = int(now - now % 86400) + 43200
+    return {'lat': lat, 'lon': lon,
+            'date_iso': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(day)),
+            'date': day, 'value': round(Synth(key).uniform(0, 11), 2)}
+
+
+def uvi_forecast(params, key, now):
+    (lat, lon) = coordinates(params, key)
+    s = Synth(key)
+    day = int(now - now % 86400) + 43200
+    return [{'lat': lat, 'lon': lon,
+        'date_iso': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(day + d * 86400)),
+        'date': day + d * 86400, 'value': round(s.uniform(0, 11), 2)} for d in range(1, 9)]
+
+
+def onecall(params, key, now):
+    units = params.get('units', 'standard')
+    (lat, lon) = coordinates(params, key)
+    current = weather(params, key, now)
+    s = Synth(key)
+    base = s.uniform(-5, 30)
+    hour = int(now - now % 3600)
+    day = int(now - now % 86400) + 43200
+
+    def conditions(dt, temp):
+        return {
+                'dt': dt,
+                'pressure': int(s.uniform(995, 1030)),
+                'humidity': int(s.uniform(20, 95)),
+                'dew_point': convert_temp(temp - 8, units),
+                'uvi': round(s.uniform(0, 11), 2),
+                'clouds': int(s.uniform(0, 100)),
+                'wind_speed': convert_speed(s.uniform(0, 10), units),
+                'wind_deg': int(s.uniform(0, 360)),
+                'weather': [{'id': s.random.choice([800, 801, 802, 803, 804, 500, 501, 600]),
+                    'main': 'Clouds', 'description': 'clouds', 'icon': '03d'}],
+                }
+
+    hourly = []
+    for i in range(48):
+        dt = hour + i * 3600
+        temp = base + 6 * math.sin((dt % 86400) / 86400.0 * 2 * math.pi)
+        row = conditions(dt, temp)
+        row.update({'temp': convert_temp(temp, units), 'feels_like': convert_temp(temp - 1, units),
+            'visibility': 10000, 'pop': round(s.uniform(0, 1), 2)})
+        hourly.append(row)
+
+    daily = []
+    for i in range(8):
+        dt = day + i * 86400
+        row = conditions(dt, base)
+        row.update({
+            'sunrise': dt - 20000, 'sunset': dt + 20000,
+            'temp': dict((k, convert_temp(base + d, units)) for (k, d) in
+                (('day', 3), ('min', -6), ('max', 6), ('night', -4), ('eve', 2), ('morn', -5))),
+            'feels_like': dict((k, convert_temp(base + d, units)) for (k, d) in
+                (('day', 2), ('night', -5), ('eve', 1), ('morn', -6))),
+            'pop': round(s.uniform(0, 1), 2),
+            })
+        if s.uniform(0, 1) < 0.3:
+            row['rain'] = round(s.uniform(0, 20), 2)
+        daily.append(row)
+
+    cur = conditions(current['dt'], base)
+    cur.update({'temp': current['main']['temp'], 'feels_like': current['main']['feels_like'],
+        'humidity': current['main']['humidity'], 'pressure': current['main']['pressure'],
+        'visibility': current['visibility'], 'wind_gust': current['wind']['gust'],
+        'sunrise': current['sys']['sunrise'], 'sunset': current['sys']['sunset']})
+    if 'rain' in current:
+        cur['rain'] = current['rain']
+
+    return {'lat': lat, 'lon': lon, 'timezone': 'UTC', 'timezone_offset': 0,
+            'current': cur, 'hourly': hourly, 'daily': daily}
+
+
+GENERATORS = {
+        'weather': weather,
+        'uvi': uvi,
+        'forecast': forecast,
+        'uvi/forecast': uvi_forecast,
+        'onecall': onecall,
+        }
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    behaviour = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, code, body, headers=None):
+        if 'gzip' in self.headers.get('Accept-Encoding', '') and len(body) > 0:
+            body = gzip.compress(body)
+            encoding = 'gzip'
+        else:
+            encoding = None
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        for (k, v) in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, code, data, headers=None):
+        self.send_body(code, json.dumps(data).encode('utf-8'), headers)
+
+    def do_GET(self):
+        b = self.behaviour
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/stats':
+            with b.lock:
+                self.send_json(200, dict(b.stats))
+            return
+
+        endpoint = url.path.split('/data/2.5/', 1)[-1]
+        params = dict(urllib.parse.parse_qsl(url.query))
+        b.count('requests')
+
+        time.sleep(b.delay())
+
+        if endpoint not in GENERATORS:
+            b.count('404')
+            self.send_json(404, {'cod': '404', 'message': 'Internal error'})
+            return
+
+        if 'appid' not in params:
+            b.count('401')
+            self.send_json(401, {'cod': 401, 'message': 'Invalid API key.'})
+            return
+
+        if b.over_quota() or b.chance(b.throttle_rate):
+            b.count('429')
+            self.send_json(429, {'cod': 429, 'message': 'Your account is temporary blocked due to exceeding of requests limitation of your subscription type.'},
+                    {'Retry-After': '60'})
+            return
+
+        if b.chance(b.error_rate):
+            code = b.random.choice([500, 502, 503])
+            b.count(str(code))
+            self.send_json(code, {'cod': code, 'message': 'Internal error'})
+            return
+
+        key = location_key(params)
+        if key is None:
+            b.count('400')
+            self.send_json(400, {'cod': '400', 'message': 'Nothing to geocode'})
+            return
+
+        data = GENERATORS[endpoint](params, key, time.time())
+        body = json.dumps(data).encode('utf-8')
+
+        if b.chance(b.truncate_rate):
+            b.count('truncated')
+            # Claim the full length, send only half and drop the connection
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+
+        if b.chance(b.malformed_rate):
+            b.count('malformed')
+            self.send_body(200, b'<html><body>Bad Gateway</body></html>')
+            return
+
+        b.count('200')
+        self.send_body(200, body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local OpenWeatherMap stand-in server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='median latency in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='latency spread in ms')
+    parser.add_argument('--dist', default='fixed',
+            choices=['fixed', 'uniform', 'exponential', 'lognormal'])
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--truncate-rate', type=float, default=0.0)
+    parser.add_argument('--malformed-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--calls-per-minute', type=int, default=0,
+            help='return 429 above this many calls per minute, 0 for no limit')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    Handler.behaviour = Behaviour(args)
+    server = http.server.ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    print('Serving OpenWeatherMap stand-in on http://%s:%d/data/2.5/' % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,8 @@ try:
     import polyinterface
 except ImportError:
     import pgc_interface as polyinterface
+import threading
+from nodes import metrics
 
 
 LOGGER = polyinterface.LOGGER
@@ -27,13 +29,34 @@ def add_functions_as_methods(functions):
 
 
 # Wrap all the setDriver calls so that we can check that the 
-# value exist first.
-def update_driver(self, driver, value, force=False, prec=3):
+# value exist first.  If the node (or its controller) has a publisher,
+# the update is queued there and sent when the publisher is flushed.
+# Nodes with converters (see uom.get_converters) are given metric
+# values, converted here to the node's units before rounding to prec,
+# unless convert is False (i.e. a 0 that means no data).
+def update_driver(self, driver, value, force=False, prec=3, convert=True):
     try:
-        self.setDriver(driver, round(float(value), prec), True, force, self.uom[driver])
-        LOGGER.debug('setDriver (%s, %f)' %(driver, float(value)))
+        value = float(value)
+        converters = getattr(self, 'converters', None)
+        if convert and converters and driver in converters:
+            value = converters[driver](value)
+        value = round(value, prec)
+        publisher = get_publisher(self)
+        if publisher is not None:
+            publisher.update(self, driver, value, force, self.uom[driver])
+        else:
+            self.setDriver(driver, value, True, force, self.uom[driver])
+        LOGGER.debug('setDriver (%s, %s)', driver, value)
     except:
-        LOGGER.warning('Missing data for driver ' + driver)
+        LOGGER.warning('Missing data for driver %s', driver)
+
+def get_publisher(self):
+    publisher = getattr(self, 'publisher', None)
+    if publisher is None:
+        controller = getattr(self, 'controller', None)
+        if controller is not None and controller is not self:
+            publisher = getattr(controller, 'publisher', None)
+    return publisher
 
 def get_saved_log_level(self):
     if 'customData' in self.polyConfig:
@@ -68,6 +91,100 @@ def set_logging_level(self, level=None):
 
 functions = (update_driver, get_saved_log_level, save_log_level, set_logging_level)
 
+"""
+    Change suppressing driver publisher.
+
+    Keeps the last value sent for every node/driver.  Driver updates are
+    collected with update() and sent with flush(), which only calls
+    setDriver for values that have changed by more than the driver's
+    deadband (or changed unit of measure), unless the update was forced.
+
+    usage:
+       self.publisher = DriverPublisher({('conditions', 'CLITEMP'): 0.1})
+       self.update_driver('CLITEMP', 20.04)
+       self.publisher.flush()
+"""
+
+# Default deadbands by node id and driver, changes smaller than these
+# aren't sent.  Drivers not listed here are sent whenever the value
+# changes.  The same driver name means different things on different
+# nodes (GV0 is a temperature on the weather nodes and a call count on
+# the metrics node), so they're listed per node.
+DEADBANDS = {
+        ('conditions', 'CLITEMP'): 0.1,   # temperature
+        ('conditions', 'GV0'): 0.1,       # max temp
+        ('conditions', 'GV1'): 0.1,       # min temp
+        ('conditions', 'BARPRES'): 1,     # pressure
+        ('daily', 'GV0'): 0.1,            # max temp
+        ('daily', 'GV1'): 0.1,            # min temp
+        ('daily', 'BARPRES'): 1,          # pressure
+        ('hourly', 'CLITEMP'): 0.1,       # temperature
+        ('hourly', 'BARPRES'): 1,         # pressure
+        }
+
+class DriverPublisher:
+    def __init__(self, deadbands=None):
+        self.deadbands = dict(DEADBANDS)
+        if deadbands is not None:
+            self.deadbands.update(deadbands)
+        self.lock = threading.Lock()
+        self.last = {}
+        self.pending = {}
+        self.sent = 0
+        self.suppressed = 0
+
+    # Queue a driver update. A later update of the same driver before the
+    # flush replaces this one.
+    def update(self, node, driver, value, force, uom):
+        with self.lock:
+            key = (node.address, driver)
+            if key in self.pending:
+                force = force or self.pending[key][3]
+            self.pending[key] = (node, driver, value, force, uom)
+
+    # Called with the lock held
+    def changed(self, node, key, value, uom):
+        if key not in self.last:
+            return True
+        (last_value, last_uom) = self.last[key]
+        if uom != last_uom:
+            return True
+        if value == last_value:
+            return False
+        deadband = self.deadbands.get((getattr(node, 'id', None), key[1]), 0)
+        return abs(value - last_value) + 1e-9 >= deadband
+
+    # Send the queued updates that changed.
+    def flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+
+        for key in pending:
+            (node, driver, value, force, uom) = pending[key]
+            with self.lock:
+                send = force or self.changed(node, key, value, uom)
+                if not send:
+                    self.suppressed += 1
+            if not send:
+                metrics.DRIVER_SUPPRESSED.inc(node=key[0])
+                continue
+            try:
+                node.setDriver(driver, value, True, force, uom)
+                with self.lock:
+                    self.last[key] = (value, uom)
+                    self.sent += 1
+                metrics.DRIVER_UPDATES.inc(node=key[0])
+            except Exception as e:
+                LOGGER.warning('Failed to set driver ' + driver + ' on ' + node.address + ': ' + str(e))
+
+    # Forget what was sent for a node, i.e. when it is removed.
+    def forget(self, address):
+        with self.lock:
+            for key in list(self.last):
+                if key[0] == address:
+                    del self.last[key]
+
 """
     Functions to handle custom parameters.
 
@@ -95,6 +212,7 @@ functions = (update_driver, get_saved_log_level, save_log_level, set_logging_lev
 class NSParameters:
     def __init__(self, parameters):
         self.internal = []
+        self.index = {}
 
         for p in parameters:
             self.internal.append({
@@ -106,36 +224,36 @@ class NSParameters:
                 'notice_msg': p['notice'],
                 'isChanged': False,
                 })
+            self.index[p['name']] = self.internal[-1]
 
     def set(self, name, value):
-        for p in self.internal:
-            if p['name'] == name:
-                if p['value'] != value:
-                    p['isChanged'] = True
-                else:
-                    p['isChanged'] = False
-                p['value'] = value
-                p['isSet'] = True
-                return
+        p = self.index.get(name)
+        if p is not None:
+            if p['value'] != value:
+                p['isChanged'] = True
+            else:
+                p['isChanged'] = False
+            p['value'] = value
+            p['isSet'] = True
 
     def get(self, name):
-        for p in self.internal:
-            if p['name'] == name:
-                if p['isSet']:
-                    return p['value']
-                else:
-                    return p['default']
+        p = self.index.get(name)
+        if p is not None:
+            if p['isSet']:
+                return p['value']
+            else:
+                return p['default']
 
     def isSet(self, name):
-        for p in self.internal:
-            if p['name'] == name:
-                return p['isSet']
+        p = self.index.get(name)
+        if p is not None:
+            return p['isSet']
         return False
 
     def isChanged(self, name):
-        for p in self.internal:
-            if p['name'] == name:
-                return p['isChanged']
+        p = self.index.get(name)
+        if p is not None:
+            return p['isChanged']
         return False
 
     """
@@ -0,0 +1,151 @@
+#
+#  Daily aggregation of the 3 hour forecast data
+#
+#  The forecast query returns a list of 3 hour forecast rows, projected
+#  into columns when the response is decoded (see projection.py).  The
+#  columns are reduced per (local) day to the records that
+#  DailyNode.update_forecast uses:
+#
+#     temp_max, temp_min, Hmax, Hmin   - max/min of the day
+#     pressure, speed, winddir, clouds - mean of the day
+#     rain, snow                       - sum of the day
+#     et0                              - sum of the day, only when the
+#                                        columns have hourly ET (mm)
+#     weather, dt                      - from the last row of the day
+#     uv                               - from the UV forecast for the day
+#     count                            - number of rows in the day
+#
+#  numpy is used for the grouped reductions when it is installed,
+#  otherwise the same reductions are done in plain python.
+
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Return the local day number for each of the timestamps.  The offset
+# from UTC is only looked up per row when the forecast crosses a DST
+# change.
+def _local_days(dt):
+    first = time.localtime(dt[0]).tm_gmtoff
+    last = time.localtime(dt[-1]).tm_gmtoff
+    if first == last:
+        return [(t + first) // 86400 for t in dt]
+    return [(t + time.localtime(t).tm_gmtoff) // 86400 for t in dt]
+
+
+# Index of the first row of each day
+def _group_starts(days):
+    starts = [0]
+    for i in range(1, len(days)):
+        if days[i] != days[i - 1]:
+            starts.append(i)
+    return starts
+
+
+# Columns reduced by sum (and mean) in a single reduceat call
+SUM_COLUMNS = ('pressure', 'speed', 'winddir', 'clouds', 'rain', 'snow')
+MEAN_COLUMNS = ('pressure', 'speed', 'winddir', 'clouds')
+
+
+# The columns summed per day, et0 is only there in hourly ET mode
+def _sum_columns(columns):
+    if 'et0' in columns:
+        return SUM_COLUMNS + ('et0',)
+    return SUM_COLUMNS
+
+
+def _reduce_numpy(columns, starts):
+    n = len(columns['dt'])
+    idx = numpy.asarray(starts)
+    ends = numpy.append(idx[1:], n) - 1
+    count = numpy.diff(numpy.append(idx, n))
+
+    extremes = numpy.array([columns['temp'], columns['humidity']])
+    maxs = numpy.maximum.reduceat(extremes, idx, axis=1)
+    mins = numpy.minimum.reduceat(extremes, idx, axis=1)
+    sum_columns = _sum_columns(columns)
+    sums = numpy.add.reduceat(numpy.array([columns[k] for k in sum_columns]), idx, axis=1)
+
+    reduced = {
+            'temp_max': maxs[0].tolist(),
+            'temp_min': mins[0].tolist(),
+            'Hmax': maxs[1].tolist(),
+            'Hmin': mins[1].tolist(),
+            'weather': [columns['weather'][e] for e in ends],
+            'dt': [columns['dt'][e] for e in ends],
+            'count': count.tolist(),
+            }
+    for (i, k) in enumerate(sum_columns):
+        if k in MEAN_COLUMNS:
+            reduced[k] = (sums[i] / count).tolist()
+        else:
+            reduced[k] = sums[i].tolist()
+    return reduced
+
+
+def _reduce_python(columns, starts):
+    bounds = list(zip(starts, starts[1:] + [len(columns['dt'])]))
+    count = [e - s for (s, e) in bounds]
+
+    def reduce(name, func):
+        return [func(columns[name][s:e]) for (s, e) in bounds]
+
+    def mean(name):
+        return [sum(columns[name][s:e]) / (e - s) for (s, e) in bounds]
+
+    reduced = {
+            'temp_max': reduce('temp', max),
+            'temp_min': reduce('temp', min),
+            'Hmax': reduce('humidity', max),
+            'Hmin': reduce('humidity', min),
+            'pressure': mean('pressure'),
+            'speed': mean('speed'),
+            'winddir': mean('winddir'),
+            'clouds': mean('clouds'),
+            'rain': reduce('rain', sum),
+            'snow': reduce('snow', sum),
+            'weather': [columns['weather'][e - 1] for (s, e) in bounds],
+            'dt': [columns['dt'][e - 1] for (s, e) in bounds],
+            'count': count,
+            }
+    if 'et0' in columns:
+        reduced['et0'] = reduce('et0', sum)
+    return reduced
+
+
+# Reduce the 3 hour forecast columns to a list of daily records.  The
+# last day is left off unless it is fully covered by the forecast.
+# uv is the list of daily UV index forecasts.
+def daily_forecast(columns, uv):
+    if len(columns['dt']) == 0:
+        return []
+
+    starts = _group_starts(_local_days(columns['dt']))
+
+    if numpy is not None:
+        reduced = _reduce_numpy(columns, starts)
+    else:
+        reduced = _reduce_python(columns, starts)
+
+    days = len(starts) - 1
+    if reduced['count'][-1] == 8:
+        days += 1
+
+    fcast = []
+    for day in range(0, days):
+        record = {}
+        for k in reduced:
+            record[k] = reduced[k][day]
+        record['dt'] = int(record['dt'])
+        record['count'] = int(record['count'])
+        if day < len(uv):
+            record['uv'] = uv[day]
+        else:
+            record['uv'] = 0.0
+        fcast.append(record)
+
+    return fcast
@@ -0,0 +1,162 @@
+#
+#  Astronomical terms for the evapotranspiration calculation
+#
+#  The solar declination, earth-sun distance, sunset hour angle and the
+#  extraterrestrial and clear sky radiation only depend on the latitude,
+#  the day of the year and (for the clear sky radiation) the elevation.
+#  A Table holds them for all 366 days of a latitude and elevation so
+#  the ET calculations only have to do the weather arithmetic.
+#
+#  The tables are memoized, table() builds one the first time a
+#  latitude/elevation is used.  At most MAX_TABLES are kept (resize()
+#  makes room for all of the configured locations), the least recently
+#  used one is dropped, and retain() drops the tables of locations that
+#  are no longer configured.
+#
+#  Days are numbered 1 to 366 like tm_yday.  A day where the sunset hour
+#  angle is undefined (polar day or night, where the daily formula in
+#  et3.py raises a math domain error) has a ra of nan.
+#
+#  usage:
+#     t = astro.table(36.82, 401.33)
+#     t.ra[289], t.rso[289], t.declination[289]
+
+import array
+import collections
+import math
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAX_TABLES = 32
+DAYS = 366
+
+solarConstant = 0.0820
+
+COLUMNS = (
+        'dist',         # relative earth-sun distance
+        'declination',  # solar declination, radians
+        'omega_s',      # sunset hour angle, limited to [0, pi] for polar days
+        'sin_sin',      # sin(latitude) * sin(declination)
+        'cos_cos',      # cos(latitude) * cos(declination)
+        'ra',           # extraterrestrial radiation, MJ/m2/day
+        'rso',          # clear sky radiation, MJ/m2/day
+        'ra_est',       # Ra used by et3.calc_solar_radiation
+        'sc',           # seasonal correction for solar time, hours
+        )
+
+
+# The terms for one day, in the order of COLUMNS.  The same equations as
+# the functions in et3.py.
+def day_terms(latitude, elevation, day):
+    latitude_r = math.pi / 180 * latitude
+    dist = 1 + 0.033 * math.cos(((2 * math.pi) / 365) * day)
+    declination = 0.409 * math.sin(((2 * math.pi) / 365) * day - 1.39)
+    sin_sin = math.sin(latitude_r) * math.sin(declination)
+    cos_cos = math.cos(latitude_r) * math.cos(declination)
+
+    x = -1 * math.tan(latitude_r) * math.tan(declination)
+    omega_s = math.acos(min(max(x, -1.0), 1.0))
+    if -1.0 <= x <= 1.0:
+        ra = 24*60 / math.pi * (solarConstant * dist) * (omega_s * sin_sin + cos_cos * math.sin(omega_s))
+    else:
+        ra = float('nan')
+    rso = (0.75 + (2 * math.pow(10, -5)) * elevation) * ra
+    ra_est = 24.0 / math.pi * 4.92 * dist * (omega_s * sin_sin + cos_cos * math.sin(omega_s))
+
+    b = 2 * math.pi * (day - 81) / 364
+    sc = 0.1645 * math.sin(2 * b) - 0.1255 * math.cos(b) - 0.025 * math.sin(b)
+    return (dist, declination, omega_s, sin_sin, cos_cos, ra, rso, ra_est, sc)
+
+
+class Table:
+    def __init__(self, latitude, elevation):
+        self.latitude = latitude
+        self.elevation = elevation
+        columns = [array.array('d', [0.0] * (DAYS + 1)) for c in COLUMNS]
+        # index 0 is left unused so the day of the year is the index
+        for day in range(1, DAYS + 1):
+            for (column, value) in zip(columns, day_terms(latitude, elevation, day)):
+                column[day] = value
+        for (name, column) in zip(COLUMNS, columns):
+            setattr(self, name, column)
+
+        # numpy views of the same memory for the batched calculations
+        self.arrays = None
+        if numpy is not None:
+            self.arrays = dict((name, numpy.frombuffer(column, dtype=float))
+                    for (name, column) in zip(COLUMNS, columns))
+
+    # True if day can be looked up, the ET functions are also called with
+    # other day numbers
+    @staticmethod
+    def covers(day):
+        return isinstance(day, int) and 1 <= day <= DAYS
+
+
+_tables = collections.OrderedDict()
+_lock = threading.Lock()
+_last = None
+_size = MAX_TABLES
+stats = {'built': 0, 'evicted': 0}
+
+
+def table(latitude, elevation):
+    # ints hash like the same floats, no need to convert
+    key = (latitude, elevation)
+    t = _tables.get(key)
+    if t is not None:
+        # this is called for every ET calculation, only take the lock
+        # when the LRU order changes
+        if _last != key:
+            touch(key)
+        return t
+
+    # built outside the lock, two threads building the same table just
+    # do the work twice
+    t = Table(float(latitude), float(elevation))
+    with _lock:
+        _tables[key] = t
+        stats['built'] += 1
+        while len(_tables) > _size:
+            _tables.popitem(last=False)
+            stats['evicted'] += 1
+    touch(key)
+    return t
+
+
+# Keep at most size tables, never fewer than MAX_TABLES
+def resize(size):
+    global _size
+    with _lock:
+        _size = max(size, MAX_TABLES)
+        while len(_tables) > _size:
+            _tables.popitem(last=False)
+            stats['evicted'] += 1
+
+
+# Make key the most recently used table
+def touch(key):
+    global _last
+    with _lock:
+        if key in _tables:
+            _tables.move_to_end(key)
+            _last = key
+
+
+# Drop the tables that aren't for one of the (latitude, elevation) keys
+def retain(keys):
+    keys = set(keys)
+    with _lock:
+        for key in list(_tables):
+            if key not in keys:
+                del _tables[key]
+                stats['evicted'] += 1
+
+
+def clear():
+    with _lock:
+        _tables.clear()
@@ -0,0 +1,105 @@
+#
+#  Response cache for the OpenWeatherMap queries
+#
+#  Responses are cached in memory keyed on the endpoint and the
+#  normalized request parameters.  Each endpoint has its own time to
+#  live and the cache is bounded in size, evicting the least recently
+#  used entry when it is full.
+#
+#  usage:
+#     cache = ResponseCache({'weather': 120, 'forecast': 1800}, size=64)
+#     key = cache.make_key('weather', 'zip=94040&units=metric')
+#     jdata = cache.get(key)
+#     if jdata is None:
+#        jdata = fetch()
+#        cache.put(key, jdata)
+
+import collections
+import threading
+import time
+import urllib.parse
+
+# Default time to live, in seconds, for each endpoint.  The current
+# conditions are cached for less than the shortPoll interval so each
+# poll still sees new data, the forecast data changes only every few
+# hours.
+DEFAULT_TTL = {
+        'weather': 120,
+        'uvi': 600,
+        'forecast': 1800,
+        'uvi/forecast': 3600,
+        'onecall': 120,
+        }
+
+
+class ResponseCache:
+    def __init__(self, ttl=None, size=64, default_ttl=60):
+        self.ttl = dict(DEFAULT_TTL)
+        if ttl is not None:
+            self.ttl.update(ttl)
+        self.size = size
+        self.default_ttl = default_ttl
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Build a cache key from the endpoint and the query string. The
+    # parameters are sorted so the order they appear in doesn't matter.
+    def make_key(self, endpoint, query):
+        params = urllib.parse.parse_qsl(query, keep_blank_values=True)
+        params = tuple(sorted((k.strip().lower(), v.strip()) for (k, v) in params))
+        return (endpoint, params)
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            (expires, data) = entry
+            if expires <= now:
+                del self.entries[key]
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        ttl = self.ttl.get(key[0], self.default_ttl)
+        if ttl <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = (time.time() + ttl, data)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    # Change the number of entries kept, i.e. when the number of
+    # locations changes.  Shrinking evicts the least recently used.
+    def resize(self, size):
+        with self.lock:
+            self.size = size
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                }
@@ -5,6 +5,18 @@
 # http://edis.ifas.ufl.edu/pdffiles/ae/ae45900.pdf
 
 import math
+import time
+
+try:
+    from nodes import astro
+except ImportError:
+    # run stand-alone, python3 nodes/et3.py
+    import astro
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # Formulas and constants
 vaporRate = 237.3
@@ -12,18 +24,12 @@ enthalpy = 17.27
 kelvin = 273.15
 solarConstant = 0.0820
 
-def FtoC(f):
-    return (f - 32) / 1.8
-
 def ft2m (ft):
     return ft * 0.3048
 
 def w2mj (watt):  # watts/m2 to megajoul/m2
     return watt * 0.0864
 
-def mph2ms (mph): # MPH to m/s
-    return mph * 0.477
-
 def deg2rad(deg):
     return math.pi / 180 * deg
 
@@ -146,30 +152,26 @@ def evapotranspriation(max_t, min_t, solar_radiation, avg_ws, elevation, max_h,
     # step 11.1, vapor pressure deficit
     vp_deficit = vp_curve - vp_actual
 
-    # step 12.1, relative sun earth distance
-    dist = relative_earth_sun_distance(julian_day)
-
-    # step 12.2, solar declination
-    declination = solar_declination(julian_day)
-
-    # step 13, latitude in radians
-    latitude_r = deg2rad(latitude)
+    # steps 12 to 16 only depend on the latitude, elevation and day,
+    # they're looked up in the location's table (see astro.py)
+    if astro.Table.covers(julian_day):
+        table = astro.table(latitude, elevation)
+        Ra = table.ra[julian_day]
+        Rso = table.rso[julian_day]
+        Ra_est = table.ra_est[julian_day]
+    else:
+        (dist, declination, angle, sin_sin, cos_cos, Ra, Rso, Ra_est, Sc) = \
+                astro.day_terms(latitude, elevation, julian_day)
+    if math.isnan(Ra):
+        # no sunset hour angle at polar latitudes
+        raise ValueError('math domain error')
 
     ## Testing solar radiation calculation
     if solar_radiation is None:
-        Rs = calc_solar_radiation(min_t, max_t, latitude_r, declination, julian_day)
+        Rs = 0.17 * math.sqrt(max_t - min_t) * Ra_est
     else:
         Rs = w2mj(solar_radiation)
 
-    # step 14, sunset hour angle
-    angle = sunset_hour_angle(latitude_r, declination)
-
-    # step 15, extraerrestrial radiation
-    Ra = extraterrestrial_radiation(dist, angle, latitude_r, declination)
-
-    # step 16, clear sky solar radiation
-    Rso = clear_sky_solar_radiation(elevation, Ra)
-
     # step 17, net solar radiation
     Rns = (1 - canopy_coefficient) * Rs
 
@@ -195,6 +197,221 @@ def evapotranspriation(max_t, min_t, solar_radiation, avg_ws, elevation, max_h,
 
 
 
+# Batched version of evapotranspriation().
+#
+# All of the arguments may be arrays (or scalars, which are broadcast)
+# and ET0 is computed for every element in one vectorized pass.  It uses
+# the same equations as the scalar version, in the same order, so the
+# results match the scalar path to within 1e-9 mm/day (floating point
+# rounding only).  Where the scalar version would raise a math domain
+# error (sunset hour angle at polar latitudes) the result is nan.
+#
+# Without numpy, this falls back to calling the scalar version for each
+# element and returns a list.
+def evapotranspriation_batch(max_t, min_t, solar_radiation, avg_ws, elevation, max_h, min_h, latitude, canopy_coefficient, day):
+    if numpy is None:
+        return _evapotranspriation_loop(max_t, min_t, solar_radiation, avg_ws, elevation, max_h, min_h, latitude, canopy_coefficient, day)
+
+    np = numpy
+    max_t = np.asarray(max_t, dtype=float)
+    min_t = np.asarray(min_t, dtype=float)
+    avg_ws = np.asarray(avg_ws, dtype=float)
+    elevation = np.asarray(elevation, dtype=float)
+    max_h = np.asarray(max_h, dtype=float)
+    min_h = np.asarray(min_h, dtype=float)
+    latitude = np.asarray(latitude, dtype=float)
+    canopy_coefficient = np.asarray(canopy_coefficient, dtype=float)
+    julian_day = np.asarray(day, dtype=float)
+
+    with np.errstate(invalid='ignore'):
+        mean_t = (max_t + min_t) / 2.0
+
+        sv_max = 0.6108 * np.exp((enthalpy * max_t) / (max_t + vaporRate))
+        sv_min = 0.6108 * np.exp((enthalpy * min_t) / (min_t + vaporRate))
+        sv_mean = 0.6108 * np.exp((enthalpy * mean_t) / (mean_t + vaporRate))
+
+        vp_slope = (4098 * sv_mean) / np.power(mean_t + vaporRate, 2)
+        pressure = 101.3 * np.power((293 - 0.0065 * elevation) / 293, 5.26)
+        psychrometric = 0.000665 * pressure
+
+        bottom = vp_slope + psychrometric * (1 + 0.34 * avg_ws)
+        delta = vp_slope / bottom
+        psi = psychrometric / bottom
+        t_term = (900) / (mean_t + kelvin) * avg_ws
+
+        vp_curve = (sv_max + sv_min) / 2
+        vp_actual = (sv_min * (max_h / 100) + sv_max * (min_h / 100)) / 2
+
+        # one latitude and elevation, the usual case, take the
+        # astronomical terms from the location's table
+        days = julian_day.astype(int)
+        if latitude.ndim == 0 and elevation.ndim == 0 and np.all(days == julian_day) and \
+                np.all(days >= 1) and np.all(days <= astro.DAYS):
+            table = astro.table(float(latitude), float(elevation)).arrays
+            Ra_est = table['ra_est'][days]
+            Ra = table['ra'][days]
+            Rso = table['rso'][days]
+        else:
+            dist = 1 + 0.033 * np.cos(((2 * math.pi) / 365) * julian_day)
+            declination = 0.409 * np.sin(((2 * math.pi) / 365) * julian_day - 1.39)
+            latitude_r = math.pi / 180 * latitude
+
+            omega = np.arccos(np.clip(-np.tan(latitude_r) * np.tan(declination), -1.0, 1.0))
+            Ra_est = 24.0 / math.pi * 4.92 * dist * (omega * np.sin(latitude_r) * np.sin(declination) + np.cos(latitude_r) * np.cos(declination) * np.sin(omega))
+
+            angle = np.arccos(-1 * np.tan(latitude_r) * np.tan(declination))
+            Ra = (24*60 / math.pi) * (solarConstant * dist) * ((angle * np.sin(latitude_r) * np.sin(declination)) + (np.cos(latitude_r) * np.cos(declination) * np.sin(angle)))
+            Rso = (0.75 + (2 * math.pow(10, -5)) * elevation) * Ra
+
+        if solar_radiation is None:
+            Rs = 0.17 * np.sqrt(max_t - min_t) * Ra_est
+        else:
+            Rs = np.asarray(solar_radiation, dtype=float) * 0.0864
+
+        Rns = (1 - canopy_coefficient) * Rs
+        Rnl = 4.903 * math.pow(10, -9) * \
+                (np.power(max_t + kelvin, 4) + np.power(min_t + kelvin, 4)) / 2 * \
+                (0.34 - 0.14 * np.sqrt(vp_actual)) * \
+                (1.35 * Rs / Rso - 0.35)
+        Rn = Rns - Rnl
+
+        radiation_term = delta * (Rn * 0.408)
+        wind_term = psi * t_term * (vp_curve - vp_actual)
+
+    return radiation_term + wind_term
+
+
+def _evapotranspriation_loop(*args):
+    columns = []
+    size = 1
+    for a in args:
+        if isinstance(a, (list, tuple)):
+            size = max(size, len(a))
+    for a in args:
+        if isinstance(a, (list, tuple)):
+            columns.append(a)
+        else:
+            columns.append([a] * size)
+
+    et0 = []
+    for row in zip(*columns):
+        try:
+            et0.append(evapotranspriation(*row))
+        except ValueError:
+            et0.append(float('nan'))
+    return et0
+
+
+# Hourly (sub-daily) reference ET, FAO-56 equation 53, for forecast
+# periods of 'hours' hours starting at the unix times in dt.
+#
+# temperature in C
+# humidity in percent
+# avg_ws in m/s
+# clouds in percent, used for the fraction of sunshine n/N = 1 - clouds
+# latitude and longitude in degrees
+# elevation in meters
+#
+# The solar radiation is estimated from the cloud cover with the
+# Angstrom formula (equation 35) and the extraterrestrial radiation of
+# the period (equation 28).  Because Rs/Rso only depends on the cloud
+# cover it is also known at night, where FAO-56 would otherwise carry
+# the ratio over from before sunset.  Returns the ET0 in mm for each
+# period, summing them gives the daily total.
+def hourly_evapotranspiration(temp, humidity, avg_ws, clouds, dt, hours, latitude, longitude, elevation, canopy_coefficient):
+    middle = dt + hours * 1800
+    julian_day = time.gmtime(middle).tm_yday
+    table = astro.table(latitude, elevation)
+    omega_s = table.omega_s[julian_day]
+
+    # solar time angles at the middle, start and end of the period,
+    # limited to the time the sun is up.  Sc is the seasonal correction
+    # for solar time.
+    solar_time = (middle % 86400) / 3600.0 + longitude / 15.0 + table.sc[julian_day]
+    omega = math.pi / 12 * (solar_time - 12)
+    omega = (omega + math.pi) % (2 * math.pi) - math.pi
+    omega1 = min(max(omega - math.pi * hours / 24, -omega_s), omega_s)
+    omega2 = min(max(omega + math.pi * hours / 24, -omega_s), omega_s)
+
+    # extraterrestrial radiation for the period, MJ/m2
+    Ra = 12 * 60 / math.pi * solarConstant * table.dist[julian_day] * \
+            ((omega2 - omega1) * table.sin_sin[julian_day] +
+             table.cos_cos[julian_day] * (math.sin(omega2) - math.sin(omega1)))
+
+    sunshine = 1 - clouds / 100.0
+    Rs = (0.25 + 0.5 * sunshine) * Ra
+    ratio = min((0.25 + 0.5 * sunshine) / (0.75 + 2e-5 * elevation), 1.0)
+
+    es = saturation_vapor(temp)
+    ea = es * humidity / 100
+    Rns = (1 - canopy_coefficient) * Rs
+    Rnl = 4.903e-9 / 24 * hours * math.pow(temp + kelvin, 4) * \
+            (0.34 - 0.14 * math.sqrt(ea)) * (1.35 * ratio - 0.35)
+    Rn = Rns - Rnl
+
+    # soil heat flux, day and night
+    if Ra > 0:
+        G = 0.1 * Rn
+    else:
+        G = 0.5 * Rn
+
+    vp_slope = saturation_vapor_pressure_curve_slope(temp)
+    psychrometric = psychrometric_constant(atmospheric_pressure(elevation))
+    top = 0.408 * vp_slope * (Rn - G) + \
+            psychrometric * (37 * hours) / (temp + kelvin) * avg_ws * (es - ea)
+    return top / (vp_slope + psychrometric * (1 + 0.34 * avg_ws))
+
+
+# Batched version of hourly_evapotranspiration() for all of the rows of
+# a forecast in one vectorized pass.  temp, humidity, avg_ws, clouds and
+# dt are the forecast columns, the rest are scalars.  Without numpy this
+# calls the scalar version for each row and returns a list.
+def hourly_evapotranspiration_batch(temp, humidity, avg_ws, clouds, dt, hours, latitude, longitude, elevation, canopy_coefficient):
+    if numpy is None:
+        return [hourly_evapotranspiration(t, h, w, c, d, hours, latitude, longitude, elevation, canopy_coefficient)
+                for (t, h, w, c, d) in zip(temp, humidity, avg_ws, clouds, dt)]
+
+    np = numpy
+    temp = np.asarray(temp, dtype=float)
+    humidity = np.asarray(humidity, dtype=float)
+    avg_ws = np.asarray(avg_ws, dtype=float)
+    clouds = np.asarray(clouds, dtype=float)
+    middle = np.asarray(dt, dtype=np.int64) + int(hours * 1800)
+
+    julian_day = (middle.astype('datetime64[s]').astype('datetime64[D]') -
+            middle.astype('datetime64[s]').astype('datetime64[Y]')).astype(int) + 1
+    table = astro.table(latitude, elevation).arrays
+    omega_s = table['omega_s'][julian_day]
+
+    solar_time = (middle % 86400) / 3600.0 + longitude / 15.0 + table['sc'][julian_day]
+    omega = math.pi / 12 * (solar_time - 12)
+    omega = np.mod(omega + math.pi, 2 * math.pi) - math.pi
+    omega1 = np.clip(omega - math.pi * hours / 24, -omega_s, omega_s)
+    omega2 = np.clip(omega + math.pi * hours / 24, -omega_s, omega_s)
+
+    Ra = 12 * 60 / math.pi * solarConstant * table['dist'][julian_day] * \
+            ((omega2 - omega1) * table['sin_sin'][julian_day] +
+             table['cos_cos'][julian_day] * (np.sin(omega2) - np.sin(omega1)))
+
+    sunshine = 1 - clouds / 100.0
+    Rs = (0.25 + 0.5 * sunshine) * Ra
+    ratio = np.minimum((0.25 + 0.5 * sunshine) / (0.75 + 2e-5 * elevation), 1.0)
+
+    es = 0.6108 * np.exp((enthalpy * temp) / (temp + vaporRate))
+    ea = es * humidity / 100
+    Rns = (1 - canopy_coefficient) * Rs
+    Rnl = 4.903e-9 / 24 * hours * np.power(temp + kelvin, 4) * \
+            (0.34 - 0.14 * np.sqrt(ea)) * (1.35 * ratio - 0.35)
+    Rn = Rns - Rnl
+    G = np.where(Ra > 0, 0.1 * Rn, 0.5 * Rn)
+
+    vp_slope = (4098 * es) / np.power(temp + vaporRate, 2)
+    psychrometric = psychrometric_constant(atmospheric_pressure(elevation))
+    top = 0.408 * vp_slope * (Rn - G) + \
+            psychrometric * (37 * hours) / (temp + kelvin) * avg_ws * (es - ea)
+    return top / (vp_slope + psychrometric * (1 + 0.34 * avg_ws))
+
+
 if __name__ == '__main__':
     #et0 = evapotranspriation(27.3, 10.7, 16.502, 1.3, 98.5, 36, 91, 36.82, 0.17, 289)
 
@@ -204,6 +421,16 @@ if __name__ == '__main__':
     et0 = evapotranspriation(27.3, 10.7, None, 1.3, 401.33, 91, 36, 36.82, 0.23, 289)
     print("et0 = ", et0)
 
+    # same inputs over a range of days, computed in one batch
+    et0 = evapotranspriation_batch(27.3, 10.7, None, 1.3, 401.33, 91, 36, 36.82, 0.23, list(range(280, 290)))
+    print("et0 (days 280-289) = ", [float(e) for e in et0])
+
+    # one day of 3 hour periods starting at midnight UTC, day 289 of 2020
+    start = 1602806400
+    et0 = hourly_evapotranspiration_batch([12, 11, 15, 22, 26, 24, 18, 14], [90, 91, 80, 50, 36, 40, 60, 80],
+            [1.3] * 8, [20] * 8, [start + 10800 * i for i in range(8)], 3, 36.82, -95.0, 401.33, 0.23)
+    print("et0 (hourly, day 289) = ", sum(float(e) for e in et0))
+
 
 
 
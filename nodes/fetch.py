@@ -0,0 +1,199 @@
+#
+#  Asynchronous fetch engine for the OpenWeatherMap queries
+#
+#  polyinterface calls shortPoll/longPoll (and start/discover) from its
+#  own threads and expects them to be synchronous.  To let independent
+#  requests run at the same time, the engine owns a private asyncio event
+#  loop running in a background thread.  Callers hand it a group of
+#  requests, the requests are started together on the loop and the
+#  calling thread blocks until the whole group has completed.
+#
+#  usage:
+#     fetcher = Fetcher()
+#     (weather, uvi) = fetcher.fetch_all([url1, url2])
+#
+#  Each entry in the returned list is either the decoded JSON data or
+#  the exception raised while fetching that request.
+#
+#  All requests go through a single long-lived requests.Session so the
+#  connections to the server are pooled and kept alive between polls.
+#  Every request has a bounded connect/read timeout and asks for a
+#  compressed response.
+#
+#  An optional limiter (see scheduler.TokenBucket) is acquired before
+#  each request is sent so the engine never exceeds the API call rate.
+#
+#  Failed requests are retried and each endpoint is protected by a
+#  circuit breaker, see resilience.py.  The exceptions returned for
+#  failed requests are resilience.FetchError subclasses.
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import asyncio
+import functools
+import threading
+import concurrent.futures
+import urllib.parse
+import requests
+import requests.adapters
+from nodes import resilience
+from nodes import metrics
+
+LOGGER = polyinterface.LOGGER
+
+
+class Fetcher:
+    def __init__(self, workers=4, pool_size=4, connect_timeout=5.0,
+            read_timeout=15.0, compression='gzip, deflate', limiter=None,
+            guard=None):
+        self.workers = workers
+        self.limiter = limiter
+        self.guard = guard if guard is not None else resilience.Resilience()
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.compression = compression
+        self.loop = None
+        self.thread = None
+        self.executor = None
+        self.session = None
+        self.lock = threading.Lock()
+
+        self.stats_lock = threading.Lock()
+        self.requests = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self.opened_before = 0
+
+    # Create the session that holds the connection pool.
+    def open_session(self):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+                pool_connections=self.pool_size,
+                pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({
+            'Accept-Encoding': self.compression,
+            'Connection': 'keep-alive',
+            })
+        return session
+
+    def start(self):
+        with self.lock:
+            if self.loop is not None:
+                return
+
+            LOGGER.debug('Starting fetch engine with %d workers' % self.workers)
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='owm-http')
+            self.session = self.open_session()
+            self.loop = asyncio.new_event_loop()
+            self.loop.set_default_executor(self.executor)
+            self.thread = threading.Thread(target=self._run, name='owm-fetch')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.loop.close()
+
+    def stop(self):
+        with self.lock:
+            if self.loop is None:
+                return
+
+            LOGGER.debug('Stopping fetch engine')
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(5)
+            self.executor.shutdown(wait=False)
+            with self.stats_lock:
+                self.opened_before += self.connections_opened()
+            self.session.close()
+            self.session = None
+            self.loop = None
+            self.thread = None
+            self.executor = None
+
+    # The actual HTTP request, this runs in one of the executor threads.
+    # Retries and the circuit breaker are per endpoint (the URL path).
+    def get(self, url):
+        endpoint = urllib.parse.urlsplit(url).path
+        try:
+            jdata = self.guard.call(endpoint, functools.partial(self.request, url, endpoint))
+        except resilience.FetchError as e:
+            metrics.REQUESTS.inc(endpoint=endpoint, result=type(e).__name__)
+            raise
+        metrics.REQUESTS.inc(endpoint=endpoint, result='ok')
+        return jdata
+
+    # A single attempt, returns the response with the body read
+    def request(self, url, endpoint):
+        if self.limiter is not None:
+            self.limiter.acquire()
+        metrics.count_call()
+        with metrics.REQUEST_SECONDS.time(endpoint=endpoint):
+            c = self.session.get(url, timeout=self.timeout)
+            try:
+                body = c.content
+            except:
+                c.close()
+                raise
+        # raw.tell() is the number of bytes read off the wire, before
+        # the body was decompressed.
+        wire = c.raw.tell() if c.raw is not None else len(body)
+        with self.stats_lock:
+            self.requests += 1
+            self.bytes_received += wire
+            self.bytes_decoded += len(body)
+        return c
+
+    # Number of connections the pool had to open.  Every other request
+    # reused a kept-alive connection.
+    def connections_opened(self):
+        opened = 0
+        if self.session is None:
+            return opened
+        adapters = []
+        for adapter in self.session.adapters.values():
+            if adapter not in adapters:
+                adapters.append(adapter)
+        for adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                if pool is not None:
+                    opened += pool.num_connections
+        return opened
+
+    def stats(self):
+        with self.stats_lock:
+            opened = self.opened_before + self.connections_opened()
+            return {
+                'requests': self.requests,
+                'bytes_received': self.bytes_received,
+                'bytes_decoded': self.bytes_decoded,
+                'connections_new': opened,
+                'connections_reused': max(self.requests - opened, 0),
+                }
+
+    async def _fetch(self, url):
+        return await self.loop.run_in_executor(None, self.get, url)
+
+    async def _gather(self, urls):
+        tasks = [self._fetch(url) for url in urls]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Fetch a group of independent requests concurrently. This is called
+    # from the synchronous node server threads and blocks until all of
+    # the requests in the group have finished.
+    def fetch_all(self, urls):
+        if len(urls) == 0:
+            return []
+
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self._gather(urls), self.loop)
+        return future.result()
@@ -0,0 +1,211 @@
+#
+#  Local history of observations and evapotranspiration
+#
+#  Every value recorded is kept in an SQLite database (in WAL mode so
+#  readers don't block the writer) with its location and timestamp.
+#  record() only appends to an in-memory queue, a background thread
+#  writes the queued samples in batches so the poll path never waits
+#  on the disk.  Samples older than the retention period are pruned
+#  periodically.
+#
+#  A sample is (location, kind, timestamp, value).  Writing a sample with
+#  the same location, kind and timestamp replaces the old value, that's
+#  used for the daily ET0 which is recalculated as the forecast changes.
+#
+#  Amounts that are reported over a trailing window (the rain and snow of
+#  the last hour) are recorded with record_max() into fixed buckets that
+#  don't overlap.  Every observation in a bucket updates the same sample,
+#  which keeps the largest amount, so total() counts each hour once no
+#  matter how often it was polled.
+#
+#  usage:
+#     store = HistoryStore('history.db', retention_days=30)
+#     store.record('94040', 'temp', time.time(), 17.5)
+#     store.record_max('94040', 'rain', time.time(), 0.25, 3600)
+#     week = store.total('94040', 'rain', time.time() - 7 * 86400)
+#     hourly = store.downsample('94040', 'temp', start, end, 3600)
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import queue
+import sqlite3
+import threading
+import time
+
+LOGGER = polyinterface.LOGGER
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS samples (
+    location TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (location, kind, ts)
+) WITHOUT ROWID
+'''
+INDEX = 'CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts)'
+
+REPLACE = 'INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?)'
+# keeps the larger of the new and the stored value, without needing the
+# upsert syntax of newer SQLite versions
+REPLACE_MAX = 'INSERT OR REPLACE INTO samples VALUES (?1, ?2, ?3, ' + \
+        'MAX(?4, IFNULL((SELECT value FROM samples WHERE location = ?1 AND kind = ?2 AND ts = ?3), ?4)))'
+
+# SQL aggregate used for each downsample method
+AGGREGATES = {
+        'avg': 'AVG(value)',
+        'min': 'MIN(value)',
+        'max': 'MAX(value)',
+        'sum': 'SUM(value)',
+        'last': 'value',
+        }
+
+
+class HistoryStore:
+    def __init__(self, path, retention_days=30, batch_size=200, flush_interval=10):
+        self.path = path
+        self.retention = retention_days * 86400
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.thread = None
+        self.read_lock = threading.Lock()
+        self.reader = None
+        self.written = 0
+        self.last_prune = 0
+
+    def open(self, check_same_thread=True):
+        db = sqlite3.connect(self.path, timeout=10, check_same_thread=check_same_thread)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute(SCHEMA)
+        db.execute(INDEX)
+        db.commit()
+        return db
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, name='owm-history')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(10)
+        self.thread = None
+        with self.read_lock:
+            if self.reader is not None:
+                self.reader.close()
+                self.reader = None
+
+    # Queue a sample to be written.  This never touches the database.
+    def record(self, location, kind, ts, value):
+        if value is None:
+            return
+        self.start()
+        self.queue.put((REPLACE, (str(location), kind, int(ts), float(value))))
+
+    def record_many(self, location, ts, values):
+        for kind in values:
+            self.record(location, kind, ts, values[kind])
+
+    # Queue a sample for the bucket of size seconds that ts falls in.  The
+    # bucket keeps the largest value recorded for it.
+    def record_max(self, location, kind, ts, value, size):
+        if value is None:
+            return
+        self.start()
+        ts = int(ts) // int(size) * int(size)
+        self.queue.put((REPLACE_MAX, (str(location), kind, ts, float(value))))
+
+    def _run(self):
+        try:
+            db = self.open()
+        except Exception as e:
+            LOGGER.error('History store disabled, failed to open ' + self.path + ': ' + str(e))
+            return
+
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    sample = self.queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+                except queue.Empty:
+                    break
+                if sample is None:
+                    running = False
+                    break
+                batch.append(sample)
+
+            if len(batch) > 0:
+                try:
+                    # in order, a bucket can be updated more than once
+                    # in a batch
+                    for (sql, sample) in batch:
+                        db.execute(sql, sample)
+                    db.commit()
+                    self.written += len(batch)
+                except Exception as e:
+                    LOGGER.error('Failed to write history: ' + str(e))
+
+            if time.time() - self.last_prune > 3600:
+                self._prune(db)
+
+        db.close()
+
+    def _prune(self, db):
+        self.last_prune = time.time()
+        if self.retention <= 0:
+            return
+        try:
+            db.execute('DELETE FROM samples WHERE ts < ?', (int(time.time() - self.retention),))
+            db.commit()
+        except Exception as e:
+            LOGGER.error('Failed to prune history: ' + str(e))
+
+    def _query(self, sql, args):
+        with self.read_lock:
+            if self.reader is None:
+                self.reader = self.open(check_same_thread=False)
+            return self.reader.execute(sql, args).fetchall()
+
+    # Return the list of (timestamp, value) samples in the range
+    def query(self, location, kind, start, end=None):
+        if end is None:
+            end = time.time()
+        return self._query(
+                'SELECT ts, value FROM samples WHERE location = ? AND kind = ? AND ts >= ? AND ts <= ? ORDER BY ts',
+                (str(location), kind, int(start), int(end)))
+
+    # Return (bucket start, value) for each bucket of size seconds in the
+    # range, where value is the avg/min/max/sum/last of the samples in it.
+    def downsample(self, location, kind, start, end, size, method='avg'):
+        size = int(size)
+        sql = 'SELECT (ts / ?) * ? AS bucket, ' + AGGREGATES[method] + \
+              ' FROM samples WHERE location = ? AND kind = ? AND ts >= ? AND ts <= ?' + \
+              ' GROUP BY bucket ORDER BY bucket'
+        if method == 'last':
+            sql = 'SELECT (ts / ?) * ? AS bucket, value, MAX(ts)' + \
+                  ' FROM samples WHERE location = ? AND kind = ? AND ts >= ? AND ts <= ?' + \
+                  ' GROUP BY bucket ORDER BY bucket'
+        rows = self._query(sql, (size, size, str(location), kind, int(start), int(end)))
+        return [(r[0], r[1]) for r in rows]
+
+    # Running total of the samples in the range, i.e. rain or ET0 over
+    # the last 7 days.
+    def total(self, location, kind, start, end=None):
+        if end is None:
+            end = time.time()
+        rows = self._query(
+                'SELECT SUM(value) FROM samples WHERE location = ? AND kind = ? AND ts >= ? AND ts <= ?',
+                (str(location), kind, int(start), int(end)))
+        if len(rows) == 0 or rows[0][0] is None:
+            return 0.0
+        return rows[0][0]
@@ -0,0 +1,65 @@
+#
+#  Pluggable JSON decoder for the OpenWeatherMap responses
+#
+#  The responses are decoded with the fastest JSON library that is
+#  installed, orjson or ujson, and with the standard json module
+#  otherwise.  The OWM_JSON environment variable picks a backend (json,
+#  ujson or orjson), mostly for benchmarking.
+#
+#  All of the backends raise a ValueError for a body that isn't JSON.
+#
+#  usage:
+#     data = jsondecode.loads(response.content)
+#     jsondecode.BACKEND   -> name of the backend in use
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import json
+import os
+
+LOGGER = polyinterface.LOGGER
+
+
+def _orjson():
+    import orjson
+    return orjson.loads
+
+
+def _ujson():
+    import ujson
+    return ujson.loads
+
+
+def _json():
+    return json.loads
+
+
+BACKENDS = (('orjson', _orjson), ('ujson', _ujson), ('json', _json))
+
+BACKEND = None
+loads = json.loads
+
+
+# Switch to the named backend, or the first one that is installed.
+# Returns the name of the backend in use.
+def use(name=None):
+    global BACKEND, loads
+    for (backend, load) in BACKENDS:
+        if name is not None and name != backend:
+            continue
+        try:
+            loads = load()
+            BACKEND = backend
+            return BACKEND
+        except ImportError:
+            if name is not None:
+                LOGGER.warning('JSON backend %s is not installed, using the default', name)
+                return use()
+    loads = json.loads
+    BACKEND = 'json'
+    return BACKEND
+
+
+use(os.environ.get('OWM_JSON') or None)
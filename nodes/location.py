@@ -0,0 +1,66 @@
+#
+#  Per location state for the controller
+#
+#  The Location custom parameter may hold more than one location,
+#  separated by semicolons.  The first location is reported by the
+#  controller node itself and uses the original forecast node addresses
+#  so existing installations don't change.  Each additional location gets
+#  its own current conditions node and set of forecast nodes.
+
+
+# Split the Location custom parameter into the list of locations
+def parse_locations(value):
+    locations = []
+    for loc in value.split(';'):
+        loc = loc.strip()
+        if loc != '':
+            locations.append(loc)
+    return locations
+
+
+class Location:
+    def __init__(self, index, query, controller_address):
+        self.index = index
+        self.query = query
+        self.latitude = None
+        self.longitude = None
+
+        # (url, cache key) for each endpoint, see plan.compile_location()
+        self.requests = {}
+
+        # scheduler.Cadence tracking how often the observations change
+        self.cadence = None
+
+        # ring.ForecastRing with the hourly forecast slots, None if the
+        # hourly forecast nodes aren't enabled
+        self.ring = None
+
+        if index == 0:
+            self.address = controller_address
+            self.name = 'OpenWeatherMap'
+        else:
+            self.address = 'location_' + str(index)
+            self.name = 'Location ' + str(index)
+
+    def forecast_address(self, day):
+        if self.index == 0:
+            return 'forecast_' + str(day)
+        return 'forecast_' + str(self.index) + '_' + str(day)
+
+    def forecast_name(self, day):
+        if self.index == 0:
+            return 'Forecast ' + str(day)
+        return self.name + ' Forecast ' + str(day)
+
+    def hourly_address(self, slot):
+        if self.index == 0:
+            return 'hourly_' + str(slot)
+        return 'hourly_' + str(self.index) + '_' + str(slot)
+
+    def hourly_name(self, slot):
+        if self.index == 0:
+            return 'Hourly ' + str(slot)
+        return self.name + ' Hourly ' + str(slot)
+
+    def has_coordinates(self):
+        return self.latitude is not None
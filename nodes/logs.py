@@ -0,0 +1,128 @@
+#
+#  Logging helpers for the poll path
+#
+#  The polls run every few minutes for every location, so the logging
+#  there is kept cheap:
+#
+#   - PollSummary collects the interesting numbers from one poll job and
+#     logs them as a single key=value line (the values are also passed
+#     as the record's 'poll' attribute for structured handlers).  The
+#     line is only formatted if INFO is enabled.
+#
+#   - limited() logs a message at most once per interval for each key
+#     and reports how many repeats were dropped, so an outage doesn't
+#     write the same error for every request.
+#
+#   - trace() writes complete responses and forecast records to a
+#     separate, size capped trace file.  The trace is off unless
+#     configure_trace() is called with a size, and when it's off the
+#     data is never formatted.
+#
+#  usage:
+#     summary = PollSummary('query_conditions', 'Location 1')
+#     summary.add(requests=2, cached=0)
+#     summary.emit()
+#     limited(logging.ERROR, 'http', 'HTTP request failed: %s', error)
+#     trace('weather', jdata)
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import json
+import logging
+import logging.handlers
+import threading
+import time
+
+LOGGER = polyinterface.LOGGER
+
+TRACE = logging.getLogger('owm-trace')
+TRACE.propagate = False
+TRACE.setLevel(logging.DEBUG)
+
+
+class PollSummary:
+    def __init__(self, job, location=None):
+        self.start = time.perf_counter()
+        self.fields = {'job': job}
+        if location is not None:
+            self.fields['location'] = location
+
+    def add(self, **fields):
+        self.fields.update(fields)
+
+    def __str__(self):
+        return ' '.join('%s=%s' % (k, self.fields[k]) for k in self.fields)
+
+    def emit(self, logger=LOGGER):
+        self.fields['ms'] = int((time.perf_counter() - self.start) * 1000)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('poll %s', self, extra={'poll': dict(self.fields)})
+
+
+class LogLimiter:
+    def __init__(self, interval=600):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last = {}
+
+    def log(self, logger, level, key, msg, *args):
+        if not logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self.lock:
+            entry = self.last.get(key)
+            if entry is not None and now - entry[0] < self.interval:
+                entry[1] += 1
+                return
+            suppressed = entry[1] if entry is not None else 0
+            self.last[key] = [now, 0]
+        if suppressed > 0:
+            msg += ' (%d similar messages suppressed)'
+            args += (suppressed,)
+        logger.log(level, msg, *args)
+
+
+LIMITER = LogLimiter()
+
+
+def limited(level, key, msg, *args):
+    LIMITER.log(LOGGER, level, key, msg, *args)
+
+
+# Formats the data only when the trace record is written
+class LazyJSON:
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        try:
+            return json.dumps(self.data, separators=(',', ':'), default=str)
+        except Exception:
+            return repr(self.data)
+
+
+# Send the traces to path, keeping at most max_bytes in the file and
+# one backup.  max_bytes 0 turns the trace off.
+def configure_trace(path, max_bytes):
+    for handler in list(TRACE.handlers):
+        TRACE.removeHandler(handler)
+        handler.close()
+    if max_bytes > 0:
+        handler = logging.handlers.RotatingFileHandler(path,
+                maxBytes=max_bytes, backupCount=1)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        TRACE.addHandler(handler)
+        LOGGER.info('Tracing responses to ' + path)
+
+
+# True if the trace is on, callers check it before building the label
+# or data of a trace
+def tracing():
+    return len(TRACE.handlers) > 0
+
+
+def trace(label, data):
+    if tracing():
+        TRACE.debug('%s %s', label, LazyJSON(data))
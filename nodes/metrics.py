@@ -0,0 +1,327 @@
+#
+#  Instrumentation for the node server
+#
+#  Counters, gauges and latency histograms kept in memory and exported
+#  in the Prometheus text format, either from a small HTTP server
+#  (GET /metrics) or through the metrics node drivers.  The metrics are
+#  module level so any module can update them without having the
+#  controller passed around:
+#
+#     from nodes import metrics
+#     metrics.REQUESTS.inc(endpoint='weather', result='ok')
+#     with metrics.AGGREGATE_SECONDS.time():
+#         ...
+#
+#  DailyUsage counts API calls per UTC day so quota burn can be seen
+#  against the plan's daily allowance.
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import bisect
+import http.server
+import threading
+import time
+
+LOGGER = polyinterface.LOGGER
+
+# seconds, suited to HTTP requests and the per poll computations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+        0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key))
+    if extra is not None:
+        pairs.append(extra)
+    if len(pairs) == 0:
+        return ''
+    return '{' + ','.join('%s="%s"' % (n, v.replace('\\', '\\\\').replace('"', '\\"'))
+        for (n, v) in pairs) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def header(self):
+        return ['# HELP %s %s' % (self.name, self.help),
+                '# TYPE %s %s' % (self.name, self.type)]
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            for key in sorted(self.values):
+                lines.append(self.name + format_labels(self.labelnames, key) +
+                        ' ' + format_value(self.values[key]))
+        return lines
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(label_key(self.labelnames, labels), 0)
+
+    # Sum over all values with the given labels
+    def total(self, **labels):
+        match = [(self.labelnames.index(n), str(v)) for (n, v) in labels.items()]
+        with self.lock:
+            return sum(v for (k, v) in self.values.items()
+                    if all(k[i] == value for (i, value) in match))
+
+    def reset(self):
+        with self.lock:
+            self.values = {}
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    # values[key] = [count per bucket..., +Inf count, sum]
+    def observe(self, value, **labels):
+        key = label_key(self.labelnames, labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 2)
+                self.values[key] = counts
+            counts[idx] += 1
+            counts[-1] += value
+
+    def time(self, **labels):
+        return Timer(self, labels)
+
+    def render(self):
+        lines = self.header()
+        bounds = self.buckets + (float('inf'),)
+        with self.lock:
+            for key in sorted(self.values):
+                counts = self.values[key]
+                cumulative = 0
+                for (bound, count) in zip(bounds, counts):
+                    cumulative += count
+                    lines.append(self.name + '_bucket' +
+                            format_labels(self.labelnames, key, ('le', format_value(float(bound)))) +
+                            ' ' + str(cumulative))
+                lines.append(self.name + '_sum' + format_labels(self.labelnames, key) +
+                        ' ' + format_value(counts[-1]))
+                lines.append(self.name + '_count' + format_labels(self.labelnames, key) +
+                        ' ' + str(cumulative))
+        return lines
+
+    def count(self):
+        with self.lock:
+            return sum(sum(counts[:-1]) for counts in self.values.values())
+
+    # Estimate a quantile over all label values from the bucket counts.
+    # Returns the upper bound of the bucket the quantile falls in.
+    def quantile(self, q):
+        bounds = self.buckets + (float('inf'),)
+        with self.lock:
+            totals = [0] * len(bounds)
+            for counts in self.values.values():
+                for i in range(len(bounds)):
+                    totals[i] += counts[i]
+        n = sum(totals)
+        if n == 0:
+            return 0.0
+        rank = q * n
+        cumulative = 0
+        for (bound, count) in zip(bounds, totals):
+            cumulative += count
+            if cumulative >= rank:
+                return bound if bound != float('inf') else self.buckets[-1]
+        return self.buckets[-1]
+
+
+# API calls per UTC day
+class DailyUsage:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.day = None
+        self.counts = {}
+
+    def today(self):
+        return time.strftime('%Y-%m-%d', time.gmtime())
+
+    def inc(self, name, amount=1):
+        day = self.today()
+        with self.lock:
+            if day != self.day:
+                self.day = day
+                self.counts = {}
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def get(self, name):
+        day = self.today()
+        with self.lock:
+            if day != self.day:
+                return 0
+            return self.counts.get(name, 0)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    # fn() is called before every render to refresh gauges
+    def add_collector(self, fn):
+        if fn not in self.collectors:
+            self.collectors.append(fn)
+
+    def render(self):
+        for fn in self.collectors:
+            try:
+                fn()
+            except Exception as e:
+                LOGGER.warning('Metrics collector failed: ' + str(e))
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+USAGE = DailyUsage()
+
+REQUESTS = REGISTRY.register(Counter('owm_requests_total',
+    'OpenWeatherMap requests by endpoint and result', ('endpoint', 'result')))
+REQUEST_SECONDS = REGISTRY.register(Histogram('owm_request_seconds',
+    'OpenWeatherMap request latency, per attempt', ('endpoint',)))
+DECODE_SECONDS = REGISTRY.register(Histogram('owm_decode_seconds',
+    'JSON decode time of the responses'))
+AGGREGATE_SECONDS = REGISTRY.register(Histogram('owm_aggregate_seconds',
+    'Time to aggregate the 3 hour forecast into days'))
+ET_SECONDS = REGISTRY.register(Histogram('owm_et_seconds',
+    'Time to calculate the evapotranspiration for a day'))
+HOURLY_ET_SECONDS = REGISTRY.register(Histogram('owm_hourly_et_seconds',
+    'Time to calculate the hourly evapotranspiration of a forecast'))
+POLL_SECONDS = REGISTRY.register(Histogram('owm_poll_seconds',
+    'Time to run a poll job, from query to published drivers', ('job',)))
+DRIVER_UPDATES = REGISTRY.register(Counter('owm_driver_updates_total',
+    'Driver updates sent to the ISY by node', ('node',)))
+DRIVER_SUPPRESSED = REGISTRY.register(Counter('owm_driver_suppressed_total',
+    'Unchanged driver updates that were not sent', ('node',)))
+CALLS_TODAY = REGISTRY.register(Gauge('owm_api_calls_today',
+    'API calls made since midnight UTC'))
+QUOTA = REGISTRY.register(Gauge('owm_api_daily_quota',
+    'API calls per day allowed by the plan'))
+QUOTA_USED = REGISTRY.register(Gauge('owm_api_quota_used_ratio',
+    'Fraction of the daily API quota used today'))
+
+
+# Count an API call against today's quota
+def count_call():
+    USAGE.inc('calls')
+
+
+def update_usage(quota):
+    calls = USAGE.get('calls')
+    CALLS_TODAY.set(calls)
+    QUOTA.set(quota)
+    QUOTA_USED.set(float(calls) / quota if quota > 0 else 0.0)
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Only local clients can connect by default, host '' (or 0.0.0.0) serves
+# every interface.
+class MetricsServer:
+    def __init__(self, port, host='127.0.0.1'):
+        self.port = port
+        self.host = host
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        if self.server is not None:
+            return
+        self.server = http.server.ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='owm-metrics')
+        self.thread.daemon = True
+        self.thread.start()
+        LOGGER.info('Serving metrics on ' + (self.host or '0.0.0.0') + ':' + str(self.port))
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join(5)
+        self.server = None
+        self.thread = None
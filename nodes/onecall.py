@@ -0,0 +1,83 @@
+#
+#  One Call API support
+#
+#  The One Call endpoint returns the current conditions, the UV index,
+#  an hourly forecast for 48 hours and a daily forecast for 8 days in a
+#  single response.  These functions map the projected response (see
+#  projection.project_onecall) onto the records the rest of the node
+#  server already uses, so the nodes are updated the same way in either
+#  mode:
+#
+#     conditions(data)      -> (weather record, uvi record)
+#     daily_forecast(data)  -> aggregate.daily_forecast() records
+#
+#  Like the other endpoints it is queried in metric.
+
+
+# Current conditions in the shape of the weather and uvi records
+def conditions(data):
+    weather = dict(data['current'])
+    weather['lat'] = data['lat']
+    weather['lon'] = data['lon']
+
+    daily = data['daily']
+    if len(daily['dt']) > 0:
+        # no current high/low, use the forecast for today
+        weather['temp_max'] = daily['temp_max'][0]
+        weather['temp_min'] = daily['temp_min'][0]
+
+    uv_data = None
+    if 'uv' in weather:
+        uv_data = {'uv': weather.pop('uv')}
+
+    return (weather, uv_data)
+
+
+# Map the daily forecast onto the records aggregate.daily_forecast()
+# builds from the 3 hour forecast.  The daily forecast only has a single
+# humidity, the hourly forecast is used for the humidity range of the
+# days it covers.  When the hourly forecast has an 'et0' column (Hourly
+# ET) the days it covers completely get the sum of their hours.
+def daily_forecast(data):
+    offset = data['timezone_offset']
+    hourly = data['hourly']
+    humidity = {}
+    for (dt, h) in zip(hourly['dt'], hourly['humidity']):
+        day = (dt + offset) // 86400
+        if day in humidity:
+            humidity[day] = (min(humidity[day][0], h), max(humidity[day][1], h))
+        else:
+            humidity[day] = (h, h)
+
+    et0 = {}
+    if 'et0' in hourly:
+        for (dt, e) in zip(hourly['dt'], hourly['et0']):
+            day = (dt + offset) // 86400
+            (total, hours) = et0.get(day, (0.0, 0))
+            et0[day] = (total + e, hours + 1)
+
+    daily = data['daily']
+    records = []
+    for i in range(len(daily['dt'])):
+        day = (daily['dt'][i] + offset) // 86400
+        (hmin, hmax) = humidity.get(day, (daily['humidity'][i], daily['humidity'][i]))
+        records.append({
+            'temp_max': daily['temp_max'][i],
+            'temp_min': daily['temp_min'][i],
+            'Hmax': hmax,
+            'Hmin': hmin,
+            'pressure': daily['pressure'][i],
+            'speed': daily['speed'][i],
+            'winddir': daily['winddir'][i],
+            'clouds': daily['clouds'][i],
+            'rain': daily['rain'][i],
+            'snow': daily['snow'][i],
+            'weather': daily['weather'][i],
+            'dt': daily['dt'][i],
+            # a whole day, like 8 rows of the 3 hour forecast
+            'count': 8,
+            'uv': daily['uv'][i],
+            })
+        if et0.get(day, (0.0, 0))[1] == 24:
+            records[-1]['et0'] = et0[day][0]
+    return records
@@ -16,13 +16,52 @@ import socket
 import math
 import re
 import json
+import collections
+import functools
+import logging
+import threading
 import node_funcs
+import write_profile
 from nodes import owm_daily
+from nodes import owm_hourly
+from nodes import owm_conditions
+from nodes import owm_metrics
 from nodes import uom
+from nodes import fetch
+from nodes import cache
+from nodes import aggregate
+from nodes import et3
+from nodes import astro
+from nodes import location
+from nodes import scheduler
+from nodes import history
+from nodes import plan
+from nodes import snapshot
+from nodes import metrics
+from nodes import logs
+from nodes import onecall
+from nodes import projection
+from nodes import ring
+from nodes import resilience
 
 LOGGER = polyinterface.LOGGER
 
+HISTORY_DB = 'history.db'
+# days covered by the rain and ETo totals
+TOTAL_DAYS = 7
+TRACE_FILE = 'trace.log'
+SNAPSHOT_FILE = 'snapshot.json'
+
+# Polyglot may report the node addresses with the ISY prefix (n001_)
+NODE_PREFIX_RE = re.compile(r'^n\d{3}_')
+
+
+def node_def_id(config):
+    return config.get('node_def_id', config.get('nodedefid'))
+
+
 @node_funcs.add_functions_as_methods(node_funcs.functions)
+@node_funcs.add_functions_as_methods(owm_conditions.functions)
 class Controller(polyinterface.Controller):
     id = 'weather'
     #id = 'controller'
@@ -33,8 +72,24 @@ class Controller(polyinterface.Controller):
         self.address = 'weather'
         self.primary = self.address
         self.configured = False
-        self.discovery = False
+        self.discovery = threading.Lock()
+        # deleted nodes Polyglot's config may still list
+        self.removed_nodes = set()
         self.start_finished = False
+        self.units = 'imperial'
+        self.converters = uom.get_converters(self.units)
+        self.locations = []
+        self.bucket = scheduler.TokenBucket(60)
+        self.scheduler = scheduler.FetchScheduler()
+        self.fetcher = fetch.Fetcher(limiter=self.bucket)
+        self.history = None
+        self.publisher = node_funcs.DriverPublisher()
+        self.plan = None
+        self.cache = cache.ResponseCache()
+        self.snapshots = snapshot.SnapshotStore()
+        self.metrics_server = None
+        self.local = threading.local()   # summary of the running poll job
+        self.onecall_disabled = False
 
         self.params = node_funcs.NSParameters([{
             'name': 'APIkey',
@@ -61,6 +116,12 @@ class Controller(polyinterface.Controller):
             'notice': '',
             },
             {
+            'name': 'Hourly Forecast',
+            'default': '0',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
             'name': 'Elevation',
             'default': '0',
             'isRequired': False,
@@ -72,6 +133,72 @@ class Controller(polyinterface.Controller):
             'isRequired': False,
             'notice': '',
             },
+            {
+            'name': 'Hourly ET',
+            'default': 'false',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Calls Per Minute',
+            'default': '60',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'History Days',
+            'default': '30',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Min Poll Interval',
+            'default': '60',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Max Poll Interval',
+            'default': '1200',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Calls Per Day',
+            'default': '0',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Metrics Port',
+            'default': '0',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Metrics Host',
+            'default': '127.0.0.1',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Metrics Node',
+            'default': 'false',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Trace File Size',
+            'default': '0',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'One Call',
+            'default': 'false',
+            'isRequired': False,
+            'notice': '',
+            },
             ])
 
         self.poly.onConfig(self.process_config)
@@ -87,70 +214,462 @@ class Controller(polyinterface.Controller):
             LOGGER.debug('-- configuration is valid')
             self.removeNoticesAll()
             self.configured = True
-            if self.params.isChanged('Forecast Days'):
+            self.configure_locations()
+            if self.params.isChanged('Calls Per Minute'):
+                self.bucket.set_rate(int(self.params.get('Calls Per Minute')))
+            if self.params.isChanged('History Days'):
+                self.configure_history()
+            if self.params.isChanged('Metrics Port') or self.params.isChanged('Metrics Host'):
+                self.configure_metrics()
+            if self.params.isChanged('Trace File Size'):
+                self.configure_trace()
+            if self.params.isChanged('Forecast Days') or self.params.isChanged('Hourly Forecast') or \
+                    self.params.isChanged('Location'):
                 if self.start_finished:
-                    LOGGER.info('calling discover because forecast days set and ' + str(self.start_finished))
+                    LOGGER.info('calling discover because forecast days or locations set and ' + str(self.start_finished))
                     self.discover()
                     self.initialize()
+            elif self.params.isChanged('Units'):
+                # the data is metric, only the nodes change
+                if self.start_finished:
+                    LOGGER.info('Units changed to ' + self.params.get('Units') + ', republishing')
+                    self.discover()
+                    self.republish()
+            elif self.params.isChanged('Metrics Node') and self.start_finished:
+                self.discover()
         elif valid:
             LOGGER.debug('-- configuration not changed, but is valid')
 
     def start(self):
         LOGGER.info('Starting node server')
+        # only reinstall the profile on the ISY when it changed
+        if write_profile.write_profile(LOGGER):
+            LOGGER.info('Profile changed, installing it')
+            self.poly.installprofile()
         self.check_params()
         self.discover()
         LOGGER.info('Node server started')
 
-        # Do an initial query to get filled in as soon as possible
+        # Publish what we had before the restart, then do an initial
+        # query to get filled in as soon as possible
         if self.configured:
+            self.warm_start()
             self.initialize()
 
         self.start_finished = True
 
+    # Build the list of locations from the Location parameter. Locations
+    # that haven't changed keep the coordinates we've already looked up.
+    def configure_locations(self):
+        self.units = self.params.get('Units')
+        known = {}
+        for loc in self.locations:
+            known[(loc.index, loc.query)] = loc
+
+        min_interval = int(self.params.get('Min Poll Interval'))
+        max_interval = int(self.params.get('Max Poll Interval'))
+        locations = []
+        for (i, query) in enumerate(location.parse_locations(self.params.get('Location'))):
+            if (i, query) in known:
+                loc = known[(i, query)]
+                loc.cadence.set_limits(min_interval, max_interval)
+            else:
+                loc = location.Location(i, query, self.address)
+                loc.cadence = scheduler.Cadence(min_interval, max_interval,
+                        self.poll_interval('shortPoll', 300))
+            locations.append(loc)
+        self.locations = locations
+        self.snapshots.retain(set(loc.query for loc in locations))
+        # room for every endpoint of every location, so entries are only
+        # dropped when they expire
+        self.cache.resize(max(64, len(cache.DEFAULT_TTL) * len(locations) + 16))
+        LOGGER.info('Configured ' + str(len(self.locations)) + ' location(s)')
+        self.compile_plan()
+
+    # Compile the configuration into the request plan used by the polls
+    def compile_plan(self):
+        self.plan = plan.compile_plan(self.params)
+        self.onecall_disabled = False
+        for loc in self.locations:
+            plan.compile_location(self.plan, loc)
+            self.configure_ring(loc)
+        self.configure_astro()
+
+    # The ring keeps its slots while the number of them stays the same
+    def configure_ring(self, loc):
+        slots = self.plan.hourly_slots
+        if slots == 0:
+            loc.ring = None
+        elif loc.ring is None or loc.ring.size != slots:
+            loc.ring = ring.ForecastRing(slots, owm_hourly.FIELDS)
+
+    # Build the tables of astronomical terms for the ET of each location
+    # with coordinates (see astro.py) and drop the ones no longer used.
+    # There's room for a table per location so they're never evicted.
+    def configure_astro(self):
+        keys = set((loc.latitude, self.plan.elevation) for loc in self.locations if loc.has_coordinates())
+        astro.retain(keys)
+        astro.resize(len(self.locations))
+        for (latitude, elevation) in keys:
+            astro.table(latitude, elevation)
+
+    # Set the location coordinates and build the UV requests for them
+    def set_coordinates(self, loc, jdata):
+        lat = jdata.get('lat')
+        lon = jdata.get('lon')
+        if lat is None or lon is None:
+            return
+        if lat != loc.latitude or lon != loc.longitude:
+            loc.latitude = lat
+            loc.longitude = lon
+            plan.compile_coordinates(self.plan, loc)
+            self.snapshots.put(loc.query, 'coordinates', (lat, lon))
+            self.configure_astro()
+
+    # Keep a local history of the observations and ET0 for the number
+    # of days configured, 0 disables the history.
+    def configure_history(self):
+        days = int(self.params.get('History Days'))
+        if self.history is not None:
+            self.history.stop()
+            self.history = None
+        if days > 0:
+            LOGGER.info('Keeping ' + str(days) + ' days of history in ' + HISTORY_DB)
+            self.history = history.HistoryStore(HISTORY_DB, days)
+
+    # Serve the metrics for Prometheus on the configured host and port,
+    # port 0 disables the metrics server.
+    def configure_metrics(self):
+        port = int(self.params.get('Metrics Port'))
+        host = self.params.get('Metrics Host').strip()
+        if self.metrics_server is not None:
+            if self.metrics_server.port == port and self.metrics_server.host == host:
+                return
+            self.metrics_server.stop()
+            self.metrics_server = None
+        metrics.REGISTRY.add_collector(self.collect_metrics)
+        if port > 0:
+            try:
+                self.metrics_server = metrics.MetricsServer(port, host)
+                self.metrics_server.start()
+            except Exception as e:
+                LOGGER.error('Failed to start the metrics server on port ' + str(port) + ': ' + str(e))
+                self.metrics_server = None
+
+    # Write the complete responses to a trace file of at most this many
+    # KB (plus one backup), 0 disables the trace.
+    def configure_trace(self):
+        logs.configure_trace(TRACE_FILE, int(self.params.get('Trace File Size')) * 1024)
+
+    # The plan's daily API call allowance, if not set use the per minute
+    # rate for the whole day.
+    def daily_quota(self):
+        quota = int(self.params.get('Calls Per Day'))
+        if quota <= 0:
+            quota = int(self.params.get('Calls Per Minute')) * 1440
+        return quota
+
+    def collect_metrics(self):
+        metrics.update_usage(self.daily_quota())
+
+    def metrics_enabled(self):
+        return self.params.get('Metrics Node').lower() in ('true', 'yes', 'on', '1')
+
+    # Return the node that reports current conditions for a location
+    def conditions_node(self, loc):
+        if loc.index == 0:
+            return self
+        return self.nodes.get(loc.address)
+
+    def poll_interval(self, poll, default):
+        try:
+            return int(self.polyConfig[poll])
+        except:
+            return default
+
+    # Spread the fetches across most of the poll interval, leaving some
+    # time at the end so one cycle finishes before the next one starts.
+    def poll_window(self, poll, default):
+        return self.poll_interval(poll, default) * 0.8
+
+    # Run a query and then send all of the driver changes it made
+    def poll_job(self, query, *args, **kwargs):
+        loc = args[-1] if len(args) > 0 and isinstance(args[-1], location.Location) else None
+        summary = logs.PollSummary(query.__name__, loc.name if loc is not None else None)
+        summary.add(requests=0, cached=0, failed=0)
+        sent = self.publisher.sent
+        suppressed = self.publisher.suppressed
+        self.local.summary = summary
+        with metrics.POLL_SECONDS.time(job=query.__name__):
+            try:
+                query(*args, **kwargs)
+            finally:
+                self.publisher.flush()
+                self.local.summary = None
+                summary.add(sent=self.publisher.sent - sent,
+                        suppressed=self.publisher.suppressed - suppressed)
+                summary.emit()
+
+    # Add to the summary of the poll job running in this thread
+    def summarize(self, **counts):
+        summary = getattr(self.local, 'summary', None)
+        if summary is None:
+            return
+        for name in counts:
+            summary.fields[name] = summary.fields.get(name, 0) + counts[name]
+
+    # Query current conditions when the location's cadence says new
+    # observations should be available, then schedule the next query.
+    # The cache is bypassed, a cached response is older than the
+    # observation the query is waiting for and would count as stale.
+    def poll_conditions(self, loc, query=None):
+        if query is None:
+            query = self.query_conditions
+        seen = loc.cadence.seen
+        try:
+            self.poll_job(query, False, loc, use_cache=False)
+        finally:
+            if loc.cadence.seen == seen:
+                # the query failed
+                loc.cadence.observe(None)
+            self.schedule_conditions(loc)
+
+    def schedule_conditions(self, loc):
+        if loc not in self.locations:
+            # removed by a configuration change
+            return
+        delay = loc.cadence.next_delay()
+        LOGGER.debug('Next conditions query for %s in %d seconds', loc.name, delay)
+        self.scheduler.submit(('conditions', loc.index),
+                functools.partial(self.poll_conditions, loc), delay)
+
     def initialize(self):
-        time.sleep(2)  # give things some time to settle
-        self.query_conditions()
-        self.query_forecast()
+        # give things some time to settle
+        for loc in self.locations:
+            self.scheduler.submit(('conditions', loc.index),
+                    functools.partial(self.poll_conditions, loc, self.query_all), 2)
+
+    # Publish the data saved before the node server was stopped.  The
+    # Data Age drivers show how old it is until the first queries
+    # replace it, and the saved coordinates let the first queries for
+    # every location run concurrently.
+    def warm_start(self):
+        loaded = self.snapshots.load(SNAPSHOT_FILE, self.snapshot_meta())
+        if loaded == 0:
+            return
+        self.snapshots.retain(set(loc.query for loc in self.locations))
+        published = 0
+        for loc in self.locations:
+            coordinates = self.snapshots.get(loc.query, 'coordinates')
+            if coordinates is not None and not loc.has_coordinates():
+                (loc.latitude, loc.longitude) = coordinates[0]
+                plan.compile_coordinates(self.plan, loc)
+                self.configure_astro()
+            conditions = self.republish_conditions(loc)
+            forecast = self.republish_forecast(loc)
+            if conditions or forecast:
+                published += 1
+        self.publisher.flush()
+        LOGGER.info('Published the saved data of %d of %d locations from %s',
+                published, len(self.locations), SNAPSHOT_FILE)
+
+    # Publish the saved data again, after a units change.  Nothing is
+    # queried, the nodes convert the metric data to their new units.
+    def republish(self):
+        for loc in self.locations:
+            self.republish_conditions(loc)
+            self.republish_forecast(loc)
+        self.publisher.flush()
+
+    # The saved data is always metric, files from versions that saved
+    # it in the configured units are skipped
+    def snapshot_meta(self):
+        return {'units': 'metric'}
+
+    # The whole store is written at once, so it's saved once per
+    # shortPoll and longPoll (if it changed) rather than after every job.
+    def save_snapshots(self):
+        try:
+            self.snapshots.save(SNAPSHOT_FILE, self.snapshot_meta())
+        except Exception as e:
+            logs.limited(logging.ERROR, 'snapshot', 'Failed to save %s: %s', SNAPSHOT_FILE, e)
 
     def longPoll(self):
-        self.query_forecast()
-
+        jobs = []
+        for loc in self.locations:
+            jobs.append((('forecast', loc.index),
+                functools.partial(self.poll_job, self.query_forecast, loc)))
+        self.scheduler.spread(jobs, self.poll_window('longPoll', 600))
+        self.save_snapshots()
+        self.log_stats()
+        if 'metrics' in self.nodes:
+            self.nodes['metrics'].update_metrics(self.daily_quota())
+            self.publisher.flush()
+
+    # The conditions queries reschedule themselves, see poll_conditions().
+    # This only restarts any location that doesn't have a query pending.
     def shortPoll(self):
-        self.query_conditions()
-
-    # extra = weather or forecast or uvi
-    def get_weather_data(self, extra, lat=None, lon=None):
-        request = 'http://api.openweathermap.org/data/2.5/' + extra + '?'
-        if 'uvi' in extra:
-            request += 'lat=' + str(lat)
-            request += '&lon=' + str(lon)
-        else:
-            # if location looks like a zip code, treat it as such for backwards
-            # compatibility
-            if re.fullmatch(r'\d\d\d\d\d,..', self.params.get('Location')) != None:
-                request += 'zip=' + self.params.get('Location')
-            elif re.fullmatch(r'\d\d\d\d\d', self.params.get('Location')) != None:
-                request += 'zip=' + self.params.get('Location')
+        jobs = []
+        for loc in self.locations:
+            key = ('conditions', loc.index)
+            if not self.scheduler.is_pending(key):
+                jobs.append((key, functools.partial(self.poll_conditions, loc)))
+        self.scheduler.spread(jobs, self.poll_window('shortPoll', 300))
+        self.save_snapshots()
+
+    def get_weather_data(self, extra, loc, use_cache=True):
+        return self.get_weather_data_group([(extra, loc)], use_cache)[0]
+
+    def log_stats(self):
+        stats = self.fetcher.stats()
+        LOGGER.info('HTTP: %d requests, %d bytes received (%d decoded), %d new connections, %d reused' %
+                (stats['requests'], stats['bytes_received'],
+                    stats['bytes_decoded'], stats['connections_new'],
+                    stats['connections_reused']))
+        stats = self.cache.stats()
+        LOGGER.info('Cache: %d entries, %d hits, %d misses, %d evictions' %
+                (stats['entries'], stats['hits'], stats['misses'],
+                    stats['evictions']))
+        LOGGER.info('Scheduler: %d jobs waiting, %d requests delayed by the rate limit' %
+                (self.scheduler.backlog(), self.bucket.waits))
+        LOGGER.info('Drivers: %d updates sent, %d unchanged updates suppressed' %
+                (self.publisher.sent, self.publisher.suppressed))
+        stats = self.fetcher.guard.stats()
+        LOGGER.info('API: %d retries, %d requests short circuited, breakers %s' %
+                (stats['retries'], stats['short_circuited'], str(stats['breakers'])))
+        for loc in self.locations:
+            if loc.cadence.period is not None:
+                LOGGER.info('%s: observations every %d seconds, seen %d seconds later' %
+                        (loc.name, loc.cadence.period, loc.cadence.lag))
+
+    # Fetch a group of independent queries concurrently.  Each query is
+    # a tuple of (extra, location) and the results are returned in the
+    # same order, projected to the fields that are used (projection.py),
+    # with None for any query that failed.  Responses still in the cache
+    # are used without making a request, unless use_cache is False.
+    # extra = weather or forecast or uvi or uvi/forecast
+    def get_weather_data_group(self, queries, use_cache=True):
+        results = [None] * len(queries)
+        keys = [None] * len(queries)
+        urls = []
+        pending = []
+        for (i, (extra, loc)) in enumerate(queries):
+            (request, keys[i]) = loc.requests[extra]
+            if use_cache:
+                results[i] = self.cache.get(keys[i])
+                if results[i] is not None:
+                    LOGGER.debug('cached %s for %s', extra, loc.name)
+                    continue
+
+            LOGGER.debug('request %s for %s', extra, loc.name)
+            urls.append(request)
+            pending.append(i)
+
+        failed = 0
+        for (i, jdata) in zip(pending, self.fetcher.fetch_all(urls)):
+            (extra, loc) = queries[i]
+            if isinstance(jdata, Exception):
+                logs.limited(logging.ERROR, ('http', extra, type(jdata)),
+                        'HTTP request failed for api.openweathermap.org: %s', jdata)
+                if extra == 'onecall' and isinstance(jdata, resilience.FatalError):
+                    # i.e. the API key isn't subscribed to One Call
+                    LOGGER.warning('One Call API not available, using the individual queries: %s', jdata)
+                    self.onecall_disabled = True
+                jdata = None
+                failed += 1
+            elif self.is_valid_response(jdata):
+                if logs.tracing():
+                    logs.trace(extra + ' ' + loc.query, jdata)
+                try:
+                    jdata = projection.project(extra, jdata)
+                    self.cache.put(keys[i], jdata)
+                except ValueError as e:
+                    logs.limited(logging.ERROR, ('query', extra), 'Query failed: %s', e)
+                    jdata = None
+                    failed += 1
             else:
-                request += self.params.get('Location')
-            request += '&units=' + self.params.get('Units')
+                logs.limited(logging.ERROR, ('query', extra),
+                        'Query failed: %s', jdata.get('message'))
+                jdata = None
+                failed += 1
+            results[i] = jdata
+
+        self.summarize(requests=len(urls), cached=len(queries) - len(urls), failed=failed)
+        if len(urls) > 0:
+            self.update_driver('GV21', self.fetcher.guard.status())
+        return results
+
+    # Error responses have a 'cod' other than 200, don't cache those.
+    def is_valid_response(self, jdata):
+        if jdata is None:
+            return False
+        if isinstance(jdata, dict) and 'cod' in jdata:
+            return str(jdata['cod']) == '200'
+        return True
+
+    def use_onecall(self, loc):
+        return self.plan.onecall and not self.onecall_disabled and 'onecall' in loc.requests
+
+    # Update the conditions and forecast for a location from a single
+    # One Call query.  Returns False if the query failed so the caller
+    # can fall back to the individual queries.
+    def query_onecall(self, loc, force=False):
+        jdata = self.get_weather_data('onecall', loc)
+        if jdata == None:
+            logs.limited(logging.WARNING, ('onecall', loc.index),
+                    'One Call query failed for %s, using the individual queries', loc.name)
+            return False
+
+        (weather, uv_data) = onecall.conditions(jdata)
+        # current.dt is when the query was made, not when the data was
+        # observed, so the cadence can't learn from it
+        self.update_location_conditions(loc, weather, uv_data, force, observed=False)
+        data = dict(jdata, hourly=self.hourly_et(loc, jdata['hourly']))
+        self.publish_forecast(loc, onecall.daily_forecast(data))
+        self.publish_hourly(loc, jdata['hourly'])
+        return True
+
+    # Query current conditions and forecast together. When the location
+    # coordinates are already known, all four requests are independent
+    # and are made concurrently.
+    def query_all(self, force=False, loc=None, use_cache=True):
+        if not self.configured:
+            LOGGER.info('Skipping connection because we aren\'t configured yet.')
+            return
 
-        request += '&appid=' + self.params.get('APIkey')
+        if loc is None:
+            loc = self.locations[0]
 
-        LOGGER.debug('request = %s' % request)
-        try:
-            c = requests.get(request)
-            jdata = c.json()
-            c.close()
-            LOGGER.debug(jdata)
-        except:
-            LOGGER.error('HTTP request failed for api.openweathermap.org')
-            jdata = None
+        if self.use_onecall(loc) and self.query_onecall(loc, force):
+            return
 
-        return jdata
+        if not loc.has_coordinates():
+            # The UV queries need the coordinates that the weather query
+            # returns so this first refresh has to be done in two steps.
+            self.query_conditions(force, loc, use_cache)
+            self.query_forecast(loc)
+            return
+
+        (jdata, uv_data, fdata, uv_fdata) = self.get_weather_data_group([
+            ('weather', loc),
+            ('uvi', loc),
+            ('forecast', loc),
+            ('uvi/forecast', loc),
+            ], use_cache)
+
+        if jdata == None:
+            logs.limited(logging.ERROR, ('no data', loc.index), 'Query returned no data for %s', loc.name)
+            self.republish_conditions(loc)
+        else:
+            self.update_location_conditions(loc, jdata, uv_data, force)
 
+        if fdata == None:
+            logs.limited(logging.ERROR, ('no data', loc.index), 'Query returned no data for %s', loc.name)
+            self.republish_forecast(loc)
+        else:
+            self.update_forecast_nodes(loc, fdata, uv_fdata)
 
-    def query_conditions(self, force=False):
+    def query_conditions(self, force=False, loc=None, use_cache=True):
         # Query for the current conditions. We can do this fairly
         # frequently, probably as often as once a minute.
         #
@@ -161,86 +680,155 @@ class Controller(polyinterface.Controller):
             LOGGER.info('Skipping connection because we aren\'t configured yet.')
             return
 
+        if loc is None:
+            loc = self.locations[0]
+
+        if self.use_onecall(loc) and self.query_onecall(loc, force):
+            return
+
         try:
-            jdata = self.get_weather_data('weather')
+            if not loc.has_coordinates():
+                # Need the coordinates from the weather query before the
+                # UV index can be requested.
+                jdata = self.get_weather_data('weather', loc, use_cache)
+                uv_data = None
+                if jdata != None:
+                    self.set_coordinates(loc, jdata)
+                    uv_data = self.get_weather_data('uvi', loc, use_cache)
+            else:
+                (jdata, uv_data) = self.get_weather_data_group([
+                    ('weather', loc),
+                    ('uvi', loc),
+                    ], use_cache)
 
             if jdata == None:
-                LOGGER.error('Query returned no data')
+                logs.limited(logging.ERROR, ('no data', loc.index), 'Query returned no data for %s', loc.name)
+                self.republish_conditions(loc)
                 return
 
-            self.latitude = jdata['coord']['lat']
-            self.longitude = jdata['coord']['lon']
-
-            try:
-                uv_data = self.get_weather_data('uvi', self.latitude, self.longitude)
-                if uv_data != None:
-                    LOGGER.debug('UV index = %f' % uv_data['value'])
-                    self.update_driver('UV', uv_data['value'], force)
-                else:
-                    LOGGER.error('UV query returned no data')
-            except:
-                LOGGER.error('Failed to query for UV data')
-
-
             # TODO: Query for pollution data
         except:
-            LOGGER.error('Weather data query failed')
+            logs.limited(logging.ERROR, ('conditions', loc.index), 'Weather data query failed for %s', loc.name)
+            self.republish_conditions(loc)
             return
 
-        # Assume we always get the main section with data
-        self.update_driver('CLITEMP', jdata['main']['temp'], force)
-        self.update_driver('CLIHUM', jdata['main']['humidity'], force)
-        self.update_driver('BARPRES', jdata['main']['pressure'], force)
-        self.update_driver('GV0', jdata['main']['temp_max'], force)
-        self.update_driver('GV1', jdata['main']['temp_min'], force)
-        if 'wind' in jdata:
-            # Wind data is apparently flaky so check to make sure it exist.
-            if 'speed' in jdata['wind']:
-                self.update_driver('GV4', jdata['wind']['speed'], force)
-            if 'gust' in jdata['wind']:
-                self.update_driver('GV5', jdata['wind']['gust'], force)
-            if 'deg' in jdata['wind']:
-                self.update_driver('WINDDIR', jdata['wind']['deg'], force)
-        if 'visibility' in jdata:
-            # always reported in meters convert to either km or miles
-            if self.params.get('Units') == 'metric':
-                vis = float(jdata['visibility']) / 1000
-            else:
-                vis = float(jdata['visibility']) * 0.000621371
-            self.update_driver('DISTANC', round(vis,1), force)
-
-        rain = self.parse_precipitation(jdata, 'rain')
-        self.update_driver('GV6', round(rain, 2), force)
-
-        snow = self.parse_precipitation(jdata, 'snow')
-        self.update_driver('GV7', round(snow, 2), force)
-
-        if 'clouds' in jdata:
-            self.update_driver('GV14', jdata['clouds']['all'], force)
-        if 'weather' in jdata:
-            self.update_driver('GV13', jdata['weather'][0]['id'], force)
-        
-
-    # parse rain/snow values from data
-    def parse_precipitation(self, data, tag):
-        if tag in data:
-            if '3h' in data[tag]:
-                snow = float(data[tag]['3h'])
-            elif '1h' in data[tag]:
-                snow = float(data[tag]['1h'])
+        self.update_location_conditions(loc, jdata, uv_data, force)
+
+    # Update the current conditions node for a location.  observed is
+    # False if jdata's dt isn't the observation time.
+    def update_location_conditions(self, loc, jdata, uv_data, force=False, observed=True):
+        self.set_coordinates(loc, jdata)
+        if loc.cadence is not None:
+            if observed:
+                loc.cadence.observe(jdata.get('dt'))
             else:
-                snow = 0
-            LOGGER.debug('Found ' + tag + ' value = ' + str(snow))
+                loc.cadence.skip()
 
-            # this is reported in mm, need to convert to inches
-            if self.params.get('Units') == 'imperial':
-                snow *= 0.0393701
-        else:
-            snow = 0
+        if uv_data == None:
+            # keep the last UV index rather than losing it
+            last = self.snapshots.get(loc.query, 'conditions')
+            if last is not None:
+                uv_data = last[0][1]
+
+        self.record_conditions(loc, jdata, uv_data)
+        self.snapshots.put(loc.query, 'conditions', (jdata, uv_data))
+        self.update_totals(loc)
+
+        node = self.conditions_node(loc)
+        if node is None:
+            LOGGER.error('No conditions node for ' + loc.name)
+            return
+        node.update_conditions(jdata, uv_data, force)
+        self.update_age(loc)
+
+    # A query failed, keep publishing the last good conditions and let
+    # the Data Age driver show how old they are.
+    # Returns True if there was saved data to publish
+    def republish_conditions(self, loc):
+        last = self.snapshots.get(loc.query, 'conditions')
+        node = self.conditions_node(loc)
+        if last is None or node is None:
+            return False
+        self.summarize(stale=1)
+        logs.limited(logging.INFO, ('stale conditions', loc.index),
+                'Using conditions from %d seconds ago for %s', time.time() - last[1], loc.name)
+        (jdata, uv_data) = last[0]
+        node.update_conditions(jdata, uv_data)
+        self.update_age(loc)
+        return True
+
+    def republish_forecast(self, loc):
+        last = self.snapshots.get(loc.query, 'forecast')
+        if last is None:
+            return False
+        self.summarize(stale=1)
+        logs.limited(logging.INFO, ('stale forecast', loc.index),
+                'Using forecast from %d seconds ago for %s', time.time() - last[1], loc.name)
+        self.publish_forecast(loc, last[0], stale=True)
+        hourly = self.snapshots.get(loc.query, 'hourly')
+        if hourly is not None:
+            self.publish_hourly(loc, hourly[0], stale=True)
+        return True
+
+    # Minutes since the location's conditions were last updated
+    def update_age(self, loc):
+        age = self.snapshots.age(loc.query, 'conditions')
+        node = self.conditions_node(loc)
+        if age is not None and node is not None:
+            node.update_driver('GV22', age / 60.0, prec=0)
+
+    # Publish the running totals kept in the history store, the rain
+    # and the ETo of the last TOTAL_DAYS days.  The ETo of a day is the
+    # last one calculated from its forecast.  The samples are written in
+    # the background so the observation just recorded may not be
+    # counted until the next update.
+    def update_totals(self, loc):
+        if self.history is None:
+            return
+        node = self.conditions_node(loc)
+        if node is None:
+            return
+        now = time.time()
+        start = now - TOTAL_DAYS * 86400
+        try:
+            rain = self.history.total(loc.query, 'rain', start, now)
+            et0 = self.history.total(loc.query, 'et0', start, now)
+        except Exception as e:
+            logs.limited(logging.ERROR, 'totals', 'Failed to read the history totals: %s', e)
+            return
+        node.update_driver('GV24', rain, prec=2)
+        node.update_driver('GV25', et0, prec=2)
 
-        return snow
+    # Save the observation in the history store. Values are recorded in
+    # metric, like they are queried.
+    #
+    # The rain and snow are the amounts over the last hour (or three) so
+    # consecutive observations overlap.  They're recorded per hour, each
+    # hour keeps its largest amount, so the totals count it only once.
+    def record_conditions(self, loc, jdata, uv_data):
+        if self.history is None:
+            return
 
-    def query_forecast(self):
+        ts = jdata.get('dt', time.time())
+        values = {
+                'temp': jdata.get('temp'),
+                'humidity': jdata.get('humidity'),
+                'pressure': jdata.get('pressure'),
+                'wind': jdata.get('speed'),
+                'clouds': jdata.get('clouds'),
+                }
+        if uv_data != None and 'uv' in uv_data:
+            values['uv'] = uv_data['uv']
+        self.history.record_many(loc.query, ts, values)
+
+        for kind in ['rain', 'snow']:
+            amount = jdata.get(kind + '_1h')
+            if amount is None:
+                # only the three hour amount (or none) was reported
+                amount = jdata.get(kind, 0.0) / 3
+            self.history.record_max(loc.query, kind, ts, amount, 3600)
+
+    def query_forecast(self, loc=None):
         # Three hour forecast for 5 days (or about 30 entries). This
         # is probably too much data to send to the ISY and there isn't
         # really a good way to deal with this. Would it make sense
@@ -250,178 +838,241 @@ class Controller(polyinterface.Controller):
             LOGGER.info('Skipping connection because we aren\'t configured yet.')
             return
 
+        if loc is None:
+            loc = self.locations[0]
+
+        if self.use_onecall(loc) and self.query_onecall(loc):
+            return
+
         try:
-            jdata = self.get_weather_data('forecast')
+            if not loc.has_coordinates():
+                LOGGER.error('Location coordinates are not known yet.')
+                return
+
+            (jdata, uv_data) = self.get_weather_data_group([
+                ('forecast', loc),
+                ('uvi/forecast', loc),
+                ])
 
             if jdata == None:
-                LOGGER.error('Query returned no data')
+                logs.limited(logging.ERROR, ('no data', loc.index), 'Query returned no data for %s', loc.name)
+                self.republish_forecast(loc)
                 return
-
-            uv_data = self.get_weather_data('uvi/forecast', self.latitude, self.longitude)
-            LOGGER.info('Found ' + str(len(uv_data)) + ' UV forecasts')
-            # what if we have no UV data?  below we assume it's there and
-            # crash if it's not.
         except:
-            LOGGER.error('Foreast query failed.')
+            logs.limited(logging.ERROR, ('forecast', loc.index), 'Forecast query failed for %s', loc.name)
+            self.republish_forecast(loc)
             return
 
+        self.update_forecast_nodes(loc, jdata, uv_data)
+
+    # Map the 3 hour forecast data into days and update the forecast nodes
+    def update_forecast_nodes(self, loc, jdata, uv_data):
+        if uv_data == None:
+            logs.limited(logging.ERROR, ('uvi forecast', loc.index), 'UV forecast query returned no data')
+            uv = []
+        else:
+            uv = uv_data['uv']
+
         # Free accounts only give us a 3hr/5day forecast so the first step
         # is to map into days with min/max values.
-        fcast = []
-        LOGGER.info('Forecast has ' + str(jdata['cnt']) + ' lines of data')
-        day = 0
-        fcast.append({})
-        count = 0
-        temp_max = 0
-        temp_min = 200
-        Hmax = 0
-        Hmin = 100
-        pressure = 0
-        weather = 0
-        speed = 0
-        winddir = 0
-        clouds = 0
-        dt = 0
-        uv = 0
-        rain = 0
-        snow = 0
-        dow = -1
-
-        if 'list' in jdata:
-            for forecast in jdata['list']:
-                dt_txt = forecast['dt_txt'].split(' ')
-                LOGGER.info('Day = ' + str(day) + ' - Forecast dt = ' + str(forecast['dt']) + ' ' + time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(forecast['dt'])))
-                # Forecast may optionally have rain or snow data. Should
-                # parse that.
-                rain = self.parse_precipitation(forecast, 'rain')
-                snow = self.parse_precipitation(forecast, 'snow')
-
-                # We should convert 'dt' to local time and use that to determine day breaks.
-                hour = time.strftime('%H', time.localtime(forecast['dt']))
-                LOGGER.info('day = ' + str(dow) + ' hour = ' + hour)
-
-                if dow != time.strftime("%w", time.localtime(forecast['dt'])):
-                    if count != 0:
-                        fcast.append({})
-                        fcast[day] = {
-                            'temp_max': temp_max,
-                            'temp_min': temp_min,
-                            'Hmax': Hmax,
-                            'Hmin': Hmin,
-                            'pressure': pressure / count,
-                            'weather': weather,
-                            'speed': speed / count,
-                            'winddir': winddir / count,
-                            'clouds': clouds / count,
-                            'dt': dt,
-                            'uv': uv,
-                            'rain': rain,
-                            'snow': snow,
-                            'count': count,
-                            }
-                        day += 1
-
-                    temp_max = 0
-                    temp_min = 200
-                    Hmax = 0
-                    Hmin = 100
-                    pressure = 0
-                    weather = 0
-                    speed = 0
-                    winddir = 0
-                    clouds = 0
-                    dt = 0
-                    uv = 0
-                    rain = 0
-                    snow = 0
-                    count = 0
-                    dow = time.strftime("%w", time.localtime(forecast['dt']))
-
-                if 0 <= day < len(uv_data):
-                    uv = float(uv_data[day]['value'])
-                else:
-                    uv = 0.0
-
-                # Build daily forecast data
-                if float(forecast['main']['temp']) > temp_max:
-                    temp_max = float(forecast['main']['temp'])
-                if float(forecast['main']['temp']) < temp_min:
-                    temp_min = float(forecast['main']['temp'])
-                if float(forecast['main']['humidity']) > Hmax:
-                    Hmax = float(forecast['main']['humidity'])
-                if float(forecast['main']['humidity']) < Hmin:
-                    Hmin = float(forecast['main']['humidity'])
-                pressure += float(forecast['main']['pressure'])
-                weather = float(forecast['weather'][0]['id'])
-                speed += float(forecast['wind']['speed'])
-                winddir += float(forecast['wind']['deg'])
-                clouds += float(forecast['clouds']['all'])
-                dt = forecast['dt']
-                uv = uv
-                rain += rain
-                snow += snow
-                count += 1
-
-                
-            LOGGER.info('Created ' + str(day) +' days forecast.')
+        rows = len(jdata['dt'])
+        columns = self.hourly_et(loc, jdata)
+        with metrics.AGGREGATE_SECONDS.time():
+            fcast = aggregate.daily_forecast(columns, uv)
+        LOGGER.debug('Created %d days forecast from %d rows and %d UV forecasts',
+                len(fcast), rows, len(uv))
+        self.summarize(rows=rows)
+        self.publish_forecast(loc, fcast)
+        self.publish_hourly(loc, jdata)
+
+    # Add an 'et0' column with the ET0 (mm) of each forecast period when
+    # the Hourly ET option is set.  All of the location's periods are
+    # calculated in one batch, the daily totals are summed from them
+    # when the forecast is aggregated.  The projected columns may be
+    # cached so they're copied, not changed.
+    def hourly_et(self, loc, columns):
+        dt = columns['dt']
+        if not self.plan.hourly_et or not loc.has_coordinates() or len(dt) < 2:
+            return columns
+
+        with metrics.HOURLY_ET_SECONDS.time():
+            et0 = et3.hourly_evapotranspiration_batch(columns['temp'], columns['humidity'],
+                    columns['speed'], columns['clouds'], dt, (dt[1] - dt[0]) / 3600.0,
+                    loc.latitude, loc.longitude, self.plan.elevation, self.plan.plant_type)
+        self.summarize(et_rows=len(dt))
+        return dict(columns, et0=[float(e) for e in et0])
+
+    # Slide the location's hourly forecast ring to the new forecast rows
+    # and update the nodes for the slots that changed.  stale is set when
+    # republishing the saved rows.
+    def publish_hourly(self, loc, columns, stale=False):
+        if loc.ring is None:
+            return
+        if not stale:
+            columns = dict((f, columns[f]) for f in ('dt',) + owm_hourly.FIELDS)
+            self.snapshots.put(loc.query, 'hourly', columns)
+        changed = loc.ring.update(columns)
+        if stale:
+            # i.e. in new units, update all of the slots
+            changed = range(loc.ring.size)
+        for slot in changed:
+            node = self.nodes.get(loc.hourly_address(slot))
+            if node is not None:
+                node.update_slot(loc.ring.slot(slot))
+        self.summarize(slots=len(changed))
+
+    # Update the forecast nodes from the daily records.  stale is set
+    # when republishing the last good forecast.
+    def publish_forecast(self, loc, fcast, stale=False):
+        if not stale:
+            self.snapshots.put(loc.query, 'forecast', fcast)
+        self.summarize(days=len(fcast))
 
-            try:
-                self.removeNotice('noData')
-            except Exception as e:
-                LOGGER.error(e)
-
-            for f in range(0,int(self.params.get('Forecast Days'))):
-                address = 'forecast_' + str(f)
-                if f < len(fcast) and fcast[f] != {}:
-                    if fcast[f]['count'] == 8:
-                        self.nodes[address].update_forecast(fcast[f], self.latitude, self.params.get('Elevation'), self.params.get('Plant Type'), self.params.get('Units'))
-                    else:
-                        LOGGER.debug('Skipping update for ' + address + ' because it lacks 8 records.')
-                        try:
-                            self.addNotice('Insufficient data for forecast ' + address, 'noData')
-                        except:
-                            self.addNotice({'noData': 'Insufficent data for forecast ' + address})
+        try:
+            self.removeNotice('noData')
+        except Exception as e:
+            LOGGER.error(e)
+
+        for f in range(0, self.plan.forecast_days):
+            address = loc.forecast_address(f)
+            if f < len(fcast):
+                if fcast[f]['count'] == 8:
+                    et0 = self.nodes[address].update_forecast(fcast[f], loc.latitude, self.plan.elevation, self.plan.plant_type)
+                    if self.history is not None:
+                        # one ET0 value per day, keyed on local midnight
+                        day = datetime.date.fromtimestamp(fcast[f]['dt'])
+                        self.history.record(loc.query, 'et0', time.mktime(day.timetuple()), et0)
                 else:
-                    LOGGER.warning('No forecast information available for day ' + str(f))
+                    LOGGER.debug('Skipping update for %s because it lacks 8 records.', address)
+                    try:
+                        self.addNotice('Insufficient data for forecast ' + address, 'noData')
+                    except:
+                        self.addNotice({'noData': 'Insufficent data for forecast ' + address})
+            else:
+                LOGGER.warning('No forecast information available for day ' + str(f))
 
+    # Answer from the data we already have, the scheduled queries keep
+    # it up to date in the background.
     def query(self):
         LOGGER.info("In Query...")
+        for loc in self.locations:
+            self.update_age(loc)
+        self.publisher.flush()
         for node in self.nodes:
             self.nodes[node].reportDrivers()
 
+    # Bring the nodes in line with the configuration.  Only the
+    # difference between the nodes the configuration needs and the nodes
+    # Polyglot already has is sent to Polyglot, so running discover again
+    # (every start, every configuration change) costs next to nothing.
     def discover(self, *args, **kwargs):
-        if self.discovery:
+        if not self.discovery.acquire(blocking=False):
             LOGGER.info('Discover already running.')
             return
 
-        self.discovery = True
-        LOGGER.info("In Discovery...")
-
-        # Create any additional nodes here
+        try:
+            LOGGER.info("In Discovery...")
+            self.reconcile_nodes()
+
+            # Set the uom dictionary based on current user units preference
+            LOGGER.info('New Configure driver units to ' + self.params.get('Units'))
+            self.uom = uom.get_uom(self.params.get('Units'))
+            self.units = self.params.get('Units')
+            self.converters = uom.get_converters(self.units)
+        finally:
+            self.discovery.release()
+
+    # The nodes the configuration needs, address -> (node definition id,
+    # function creating the node)
+    def desired_nodes(self):
+        units = self.params.get('Units')
         num_days = int(self.params.get('Forecast Days'))
-        if num_days < 5:
-            # delete any extra days
-            for day in range(num_days, 5):
-                address = 'forecast_' + str(day)
-                try:
-                    self.delNode(address)
-                except:
-                    LOGGER.debug('Failed to delete node ' + address)
+        nodes = collections.OrderedDict()
+        for loc in self.locations:
+            if loc.index > 0:
+                nodes[loc.address] = (owm_conditions.ConditionsNode.id,
+                        functools.partial(owm_conditions.ConditionsNode, self,
+                            self.address, loc.address, loc.name, units))
+            for day in range(0, num_days):
+                address = loc.forecast_address(day)
+                nodes[address] = (owm_daily.DailyNode.id,
+                        functools.partial(owm_daily.DailyNode, self,
+                            self.address, address, loc.forecast_name(day), units))
+            for slot in range(0, self.plan.hourly_slots):
+                address = loc.hourly_address(slot)
+                nodes[address] = (owm_hourly.HourlyNode.id,
+                        functools.partial(owm_hourly.HourlyNode, self,
+                            self.address, address, loc.hourly_name(slot), units))
+        if self.metrics_enabled():
+            nodes['metrics'] = (owm_metrics.MetricsNode.id,
+                    functools.partial(owm_metrics.MetricsNode, self,
+                        self.address, 'metrics', 'Metrics'))
+        return nodes
+
+    # The nodes Polyglot has for this node server, address -> config
+    def known_nodes(self):
+        known = {}
+        for node in self.polyConfig.get('nodes', []):
+            address = NODE_PREFIX_RE.sub('', node.get('address', ''))
+            if address != '' and address != self.address and address not in self.removed_nodes:
+                known[address] = node
+        return known
+
+    def reconcile_nodes(self):
+        units = self.params.get('Units')
+        known = self.known_nodes()
+        desired = self.desired_nodes()
+        counts = collections.Counter()
+
+        for address in desired:
+            (nodedef, create) = desired[address]
+            node = self.nodes.get(address)
+            if node is not None and node.id == nodedef:
+                # already running, only the units may have changed
+                if getattr(node, 'units', units) != units:
+                    node.set_driver_uom(units)
+                    counts['units'] += 1
+                continue
 
-        for day in range(0,num_days):
-            address = 'forecast_' + str(day)
-            title = 'Forecast ' + str(day)
             try:
-                node = owm_daily.DailyNode(self, self.address, address, title, self.params.get('Units'))
-                self.addNode(node)
+                node = create()
+                config = known.get(address)
+                self.removed_nodes.discard(address)
+                if config is not None and node_def_id(config) == nodedef:
+                    self.adopt_node(node, config)
+                    counts['adopted'] += 1
+                else:
+                    # update replaces a node with a different definition
+                    self.addNode(node, update=config is not None)
+                    counts['added'] += 1
             except Exception as e:
-                LOGGER.error('Failed to create forecast node ' + title)
+                LOGGER.error('Failed to create node ' + address)
                 LOGGER.error(str(e))
 
-        # Set the uom dictionary based on current user units preference
-        LOGGER.info('New Configure driver units to ' + self.params.get('Units'))
-        self.uom = uom.get_uom(self.params.get('Units'))
-        self.discovery = False
+        for address in set(known) | set(self.nodes):
+            if address in desired or address == self.address:
+                continue
+            try:
+                self.delNode(address)
+                counts['removed'] += 1
+            except:
+                LOGGER.debug('Failed to delete node ' + address)
+            self.nodes.pop(address, None)
+            self.removed_nodes.add(address)
+            self.publisher.forget(address)
+
+        LOGGER.info('Discovery: %d nodes added, %d already in Polyglot, %d removed, %d changed units',
+                counts['added'], counts['adopted'], counts['removed'], counts['units'])
+
+    # Use a node that Polyglot already has.  This does what addNode does
+    # except sending the node to Polyglot again.
+    def adopt_node(self, node, config):
+        existing = dict((d['driver'], d) for d in config.get('drivers', []))
+        for driver in node.drivers:
+            if driver['driver'] in existing:
+                driver['value'] = existing[driver['driver']]['value']
+        node.isPrimary = node.address == node.primary
+        self.nodes[node.address] = node
 
     # Delete the node server from Polyglot
     def delete(self):
@@ -429,8 +1080,16 @@ class Controller(polyinterface.Controller):
 
     def stop(self):
         LOGGER.info('Stopping node server')
+        self.scheduler.stop()
+        self.fetcher.stop()
+        self.save_snapshots()
+        if self.history is not None:
+            self.history.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
 
     def update_profile(self, command):
+        write_profile.write_profile(LOGGER)
         st = self.poly.installprofile()
         return st
 
@@ -443,6 +1102,14 @@ class Controller(polyinterface.Controller):
             if int(self.params.get('Forecast Days')) > 5:
                 self.addNotice('Number of days of forecast data is limited to 5 days', 'forecast')
                 self.params.set('Forecast Days', 5)
+            if int(self.params.get('Hourly Forecast')) > plan.MAX_HOURLY_SLOTS:
+                self.addNotice('Number of hourly forecast nodes is limited to %d' % plan.MAX_HOURLY_SLOTS, 'hourly')
+                self.params.set('Hourly Forecast', plan.MAX_HOURLY_SLOTS)
+            self.bucket.set_rate(int(self.params.get('Calls Per Minute')))
+            self.configure_locations()
+            self.configure_history()
+            self.configure_metrics()
+            self.configure_trace()
         else:
             LOGGER.debug('Configuration required.')
             LOGGER.debug('APIkey = ' + self.params.get('APIkey'))
@@ -501,5 +1168,9 @@ class Controller(polyinterface.Controller):
             {'driver': 'GV14', 'value': 0, 'uom': 22},     # cloud conditions
             {'driver': 'DISTANC', 'value': 0, 'uom': 83},  # visibility
             {'driver': 'UV', 'value': 0, 'uom': 71},       # UV index
+            {'driver': 'GV21', 'value': 0, 'uom': 25},     # API status
+            {'driver': 'GV22', 'value': 0, 'uom': 45},     # data age
+            {'driver': 'GV24', 'value': 0, 'uom': 82},     # rain, last 7 days
+            {'driver': 'GV25', 'value': 0, 'uom': 82},     # ETo, last 7 days
             ]
 
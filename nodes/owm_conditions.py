@@ -0,0 +1,87 @@
+# Node definition for a current conditions node
+#
+# The controller node reports the current conditions for the first
+# location, additional locations each get one of these nodes.  The
+# functions that parse the weather query data are shared by both and
+# are added to the node classes as methods.
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+
+from nodes import uom
+import node_funcs
+
+LOGGER = polyinterface.LOGGER
+
+
+# Update the current condition drivers from the weather and uvi
+# records (see projection.py).  The records are metric, update_driver
+# converts them to the node's units.
+def update_conditions(self, jdata, uv_data, force=False):
+    if uv_data != None and 'uv' in uv_data:
+        LOGGER.debug('UV index = %s', uv_data['uv'])
+        self.update_driver('UV', uv_data['uv'], force)
+    else:
+        LOGGER.error('UV query returned no data')
+
+    # Assume we always get the main section with data
+    self.update_driver('CLITEMP', jdata['temp'], force)
+    self.update_driver('CLIHUM', jdata['humidity'], force)
+    self.update_driver('BARPRES', jdata['pressure'], force)
+    self.update_driver('GV0', jdata['temp_max'], force)
+    self.update_driver('GV1', jdata['temp_min'], force)
+
+    # Wind data is apparently flaky so check to make sure it exist.
+    for (driver, field) in OPTIONAL_DRIVERS:
+        if field in jdata:
+            self.update_driver(driver, jdata[field], force)
+
+    if 'visibility' in jdata:
+        # reported in meters, the driver is km
+        self.update_driver('DISTANC', jdata['visibility'] / 1000.0, force, prec=1)
+
+    # precipitation is reported in mm
+    self.update_driver('GV6', jdata.get('rain', 0.0), force, prec=2)
+    self.update_driver('GV7', jdata.get('snow', 0.0), force, prec=2)
+
+
+# Drivers for the fields that aren't always in the weather response
+OPTIONAL_DRIVERS = (
+        ('GV4', 'speed'),
+        ('GV5', 'gust'),
+        ('WINDDIR', 'winddir'),
+        ('GV14', 'clouds'),
+        ('GV13', 'weather'),
+        )
+
+functions = (update_conditions,)
+
+
+@node_funcs.add_functions_as_methods(node_funcs.functions)
+@node_funcs.add_functions_as_methods(functions)
+class ConditionsNode(polyinterface.Node):
+    id = 'conditions'
+    # also used by write_profile.py to build the node definition
+    driver_names = ['CLITEMP', 'CLIHUM', 'BARPRES', 'WINDDIR', 'GV0',
+            'GV1', 'GV4', 'GV5', 'GV6', 'GV7', 'GV13', 'GV14',
+            'DISTANC', 'UV', 'GV22', 'GV24', 'GV25']
+
+    def __init__(self, controller, primary, address, name, units):
+        self.uom = uom.get_uom(units)
+        self.units = units
+        self.converters = uom.get_converters(units)
+        self.drivers = []
+
+        # Use the units to build an appropriate drivers array.
+        for driver in self.driver_names:
+            self.drivers.append({'driver': driver, 'value': 0, 'uom': self.uom[driver]})
+
+        # call the default init
+        super(ConditionsNode, self).__init__(controller, primary, address, name)
+
+    def set_driver_uom(self, units):
+        self.uom = uom.get_uom(units)
+        self.units = units
+        self.converters = uom.get_converters(units)
@@ -0,0 +1,70 @@
+# Node definition for an hourly forecast node
+#
+# Each node shows one slot of the forecast ring (see ring.py), slot 0
+# is the next 3 hour period of the forecast (the next hour in One Call
+# mode).  Only created when the Hourly Forecast parameter is more than 0.
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+
+import time
+from nodes import uom
+import node_funcs
+
+LOGGER = polyinterface.LOGGER
+
+# the forecast fields kept in the ring for these nodes
+FIELDS = ('temp', 'humidity', 'pressure', 'speed', 'winddir', 'clouds',
+        'weather', 'pop', 'rain', 'snow')
+
+
+@node_funcs.add_functions_as_methods(node_funcs.functions)
+class HourlyNode(polyinterface.Node):
+    id = 'hourly'
+    # also used by write_profile.py to build the node definition
+    driver_names = ['GV23', 'CLITEMP', 'CLIHUM', 'BARPRES', 'GV4',
+            'WINDDIR', 'GV14', 'GV13', 'GV18', 'GV6', 'GV7']
+
+    def __init__(self, controller, primary, address, name, units):
+        self.uom = uom.get_uom(units)
+        self.units = units
+        self.converters = uom.get_converters(units)
+        self.drivers = []
+
+        for driver in self.driver_names:
+            self.drivers.append({'driver': driver, 'value': 0, 'uom': self.uom[driver]})
+
+        # call the default init
+        super(HourlyNode, self).__init__(controller, primary, address, name)
+
+    def set_driver_uom(self, units):
+        self.uom = uom.get_uom(units)
+        self.units = units
+        self.converters = uom.get_converters(units)
+
+    # slot is the ring slot, None when the forecast doesn't reach it.
+    # The values are metric, update_driver converts them.
+    def update_slot(self, slot):
+        if slot is None:
+            # don't leave an old period showing, the hour is -1 and
+            # the values are cleared
+            LOGGER.debug('No forecast for %s', self.address)
+            self.update_driver('GV23', -1)
+            for driver in self.driver_names[1:]:
+                self.update_driver(driver, 0, convert=False)
+            return
+
+        # the local hour the period starts at
+        self.update_driver('GV23', time.localtime(slot['dt']).tm_hour)
+        self.update_driver('CLITEMP', slot['temp'], prec=1)
+        self.update_driver('CLIHUM', slot['humidity'], prec=0)
+        self.update_driver('BARPRES', slot['pressure'], prec=1)
+        self.update_driver('GV4', slot['speed'], prec=1)
+        self.update_driver('WINDDIR', slot['winddir'], prec=0)
+        self.update_driver('GV14', slot['clouds'], prec=0)
+        self.update_driver('GV13', int(slot['weather']))
+        self.update_driver('GV18', slot['pop'] * 100, prec=0)
+        self.update_driver('GV6', slot['rain'], prec=2)
+        self.update_driver('GV7', slot['snow'], prec=2)
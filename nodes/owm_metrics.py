@@ -0,0 +1,44 @@
+# Node definition for the optional metrics node
+#
+# Shows the API usage and performance metrics (see metrics.py) in the
+# ISY.  Only created when the Metrics Node parameter is true.
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+
+from nodes import metrics
+import node_funcs
+
+LOGGER = polyinterface.LOGGER
+
+
+@node_funcs.add_functions_as_methods(node_funcs.functions)
+class MetricsNode(polyinterface.Node):
+    id = 'metrics'
+    uom = {
+            'GV0': 56,      # API calls today
+            'GV1': 51,      # percent of the daily quota used
+            'GV2': 42,      # 95th percentile request time (ms)
+            'GV3': 56,      # failed requests
+            'GV4': 56,      # driver updates sent
+            }
+    driver_names = ['GV0', 'GV1', 'GV2', 'GV3', 'GV4']
+
+    def __init__(self, controller, primary, address, name):
+        self.drivers = []
+        for driver in self.driver_names:
+            self.drivers.append({'driver': driver, 'value': 0, 'uom': self.uom[driver]})
+
+        # call the default init
+        super(MetricsNode, self).__init__(controller, primary, address, name)
+
+    def update_metrics(self, quota):
+        metrics.update_usage(quota)
+        failed = metrics.REQUESTS.total() - metrics.REQUESTS.total(result='ok')
+        self.update_driver('GV0', metrics.CALLS_TODAY.get())
+        self.update_driver('GV1', metrics.QUOTA_USED.get() * 100, prec=1)
+        self.update_driver('GV2', metrics.REQUEST_SECONDS.quantile(0.95) * 1000, prec=0)
+        self.update_driver('GV3', failed)
+        self.update_driver('GV4', metrics.DRIVER_UPDATES.total())
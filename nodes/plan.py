@@ -0,0 +1,111 @@
+#
+#  Request plan
+#
+#  When the configuration is accepted, it is compiled into a RequestPlan
+#  holding everything the poll path needs: the parsed numeric parameters
+#  and the prebuilt query strings.  The plan is never modified, a
+#  configuration change builds a new one.
+#
+#  The queries are always metric whatever the Units parameter is, the
+#  nodes convert the values when they're published.  So the cached
+#  responses and saved data don't depend on the units.
+#
+#  The request URL and cache key for each endpoint are built once per
+#  location, the UV endpoints when the location's coordinates are known.
+#  In One Call mode the onecall request is built along with the UV
+#  requests, it needs the coordinates too.  Locations given as lat/lon
+#  have their coordinates from the start.
+#
+#  The OWM_BASE_URL environment variable replaces the OpenWeatherMap
+#  base URL, used to point the node server at a local stand-in server
+#  (see bench/owm_server.py).
+
+import collections
+import os
+import re
+
+BASE_URL = 'http://api.openweathermap.org/data/2.5/'
+
+RequestPlan = collections.namedtuple('RequestPlan', [
+    'base_url',
+    'api_key',
+    'forecast_days',
+    'hourly_slots', # hourly forecast nodes per location
+    'elevation',
+    'plant_type',
+    'hourly_et',    # sum the hourly ET of the forecast periods
+    'suffix',       # appended to location queries
+    'onecall',      # use the One Call API
+    ])
+
+# the 3 hour forecast has 40 periods
+MAX_HOURLY_SLOTS = 40
+
+ZIP_RE = re.compile(r'\d\d\d\d\d(,..)?')
+LATLON_RE = re.compile(r'lat=(-?[0-9.]+)&lon=(-?[0-9.]+)')
+
+
+def base_url():
+    url = os.environ.get('OWM_BASE_URL', '').strip()
+    if url == '':
+        return BASE_URL
+    if not url.endswith('/'):
+        url += '/'
+    return url
+
+
+# Build the plan from the current parameters
+def compile_plan(params):
+    api_key = params.get('APIkey')
+
+    return RequestPlan(
+            base_url=base_url(),
+            api_key=api_key,
+            forecast_days=int(params.get('Forecast Days')),
+            hourly_slots=min(max(int(params.get('Hourly Forecast')), 0), MAX_HOURLY_SLOTS),
+            elevation=float(params.get('Elevation')),
+            plant_type=float(params.get('Plant Type')),
+            hourly_et=str(params.get('Hourly ET')).lower() in ('true', 'yes', 'on', '1'),
+            suffix='&units=metric&appid=' + api_key,
+            onecall=str(params.get('One Call')).lower() in ('true', 'yes', 'on', '1'),
+            )
+
+
+# if location looks like a zip code, treat it as such for backwards
+# compatibility
+def location_query(location):
+    if ZIP_RE.fullmatch(location) != None:
+        return 'zip=' + location
+    return location
+
+
+def request(plan, extra, query):
+    return (plan.base_url + extra + '?' + query, (extra, query))
+
+
+# Build the weather and forecast requests for a location
+def compile_location(plan, loc):
+    query = location_query(loc.query) + plan.suffix
+    loc.requests = {
+            'weather': request(plan, 'weather', query),
+            'forecast': request(plan, 'forecast', query),
+            }
+    m = LATLON_RE.fullmatch(loc.query)
+    if m is not None and not loc.has_coordinates():
+        loc.latitude = float(m.group(1))
+        loc.longitude = float(m.group(2))
+    if loc.has_coordinates():
+        compile_coordinates(plan, loc)
+
+
+# Build the UV requests once the location's coordinates are known
+def compile_coordinates(plan, loc):
+    query = 'lat=' + str(loc.latitude) + '&lon=' + str(loc.longitude) + '&appid=' + plan.api_key
+    loc.requests['uvi'] = request(plan, 'uvi', query)
+    loc.requests['uvi/forecast'] = request(plan, 'uvi/forecast', query)
+    if plan.onecall:
+        query = 'lat=' + str(loc.latitude) + '&lon=' + str(loc.longitude) + \
+                '&exclude=minutely,alerts' + plan.suffix
+        loc.requests['onecall'] = request(plan, 'onecall', query)
+    else:
+        loc.requests.pop('onecall', None)
@@ -0,0 +1,265 @@
+#
+#  Field projection for the OpenWeatherMap responses
+#
+#  The responses decode into nested dicts but the nodes only use a
+#  handful of their fields.  Each endpoint has a schema listing the
+#  fields that are used and project() turns a decoded response into
+#  flat records with only those fields, converted to their types:
+#
+#     weather       -> {'dt': .., 'temp': .., 'speed': .., 'rain': .., ...}
+#     uvi           -> {'uv': ..}
+#     forecast      -> columns, {'dt': [..], 'temp': [..], ...}
+#     uvi/forecast  -> columns, {'uv': [..]}
+#     onecall       -> {'current': record, 'daily': columns, 'hourly': columns, ...}
+#
+#  The projected records are what's cached and kept in the snapshots,
+#  the decoded response can be dropped as soon as it's projected.
+#
+#  A schema field is (name, type, path) or (name, type, path, default).
+#  The path is a dotted list of keys and list indexes, alternatives are
+#  separated by '|' and the first one found is used.  A missing field
+#  gets its default, a field without a default is left out of a record
+#  and is required in every row projected into columns.  A response
+#  that doesn't fit its schema raises a ValueError.
+
+
+EMPTY = {}
+
+
+class Field:
+    def __init__(self, name, kind, path, default=None):
+        self.name = name
+        self.kind = kind
+        self.default = default
+        self.getters = [self.getter(p.split('.')) for p in path.split('|')]
+
+    # A function returning the value at the path.  Missing keys give
+    # None rather than raising, the fields that are often left out
+    # (rain, snow) would otherwise cost an exception per row.  The
+    # common short paths avoid the loop.
+    @staticmethod
+    def getter(keys):
+        if any(k.isdigit() for k in keys):
+            keys = [int(k) if k.isdigit() else k for k in keys]
+            if len(keys) == 3:
+                (a, b, c) = keys
+                return lambda d: d[a][b][c]
+
+            def get(d):
+                for k in keys:
+                    d = d[k]
+                return d
+            return get
+        if len(keys) == 1:
+            (a,) = keys
+            return lambda d: d.get(a)
+        if len(keys) == 2:
+            (a, b) = keys
+            return lambda d: d.get(a, EMPTY).get(b)
+
+        def get(d):
+            for k in keys:
+                d = d.get(k, EMPTY)
+            return d if d is not EMPTY else None
+        return get
+
+    # The value from data, None if it's missing
+    def lookup(self, data):
+        for get in self.getters:
+            try:
+                value = get(data)
+            except (KeyError, IndexError, TypeError, AttributeError):
+                continue
+            if value is not None:
+                return value
+        return None
+
+
+def schema(*fields):
+    return [Field(*f) for f in fields]
+
+
+WEATHER = schema(
+        ('dt', int, 'dt'),
+        ('lat', float, 'coord.lat'),
+        ('lon', float, 'coord.lon'),
+        ('temp', float, 'main.temp'),
+        ('humidity', float, 'main.humidity'),
+        ('pressure', float, 'main.pressure'),
+        ('temp_max', float, 'main.temp_max'),
+        ('temp_min', float, 'main.temp_min'),
+        ('speed', float, 'wind.speed'),
+        ('gust', float, 'wind.gust'),
+        ('winddir', float, 'wind.deg'),
+        ('visibility', float, 'visibility'),
+        ('rain', float, 'rain.3h|rain.1h', 0.0),
+        ('snow', float, 'snow.3h|snow.1h', 0.0),
+        ('rain_1h', float, 'rain.1h'),
+        ('snow_1h', float, 'snow.1h'),
+        ('clouds', float, 'clouds.all'),
+        ('weather', int, 'weather.0.id'),
+        )
+
+UVI = schema(
+        ('uv', float, 'value'),
+        )
+
+FORECAST_ROW = schema(
+        ('dt', int, 'dt'),
+        ('temp', float, 'main.temp'),
+        ('humidity', float, 'main.humidity'),
+        ('pressure', float, 'main.pressure'),
+        ('weather', int, 'weather.0.id'),
+        ('speed', float, 'wind.speed'),
+        ('winddir', float, 'wind.deg'),
+        ('clouds', float, 'clouds.all'),
+        ('rain', float, 'rain.3h|rain.1h', 0.0),
+        ('snow', float, 'snow.3h|snow.1h', 0.0),
+        ('pop', float, 'pop', 0.0),
+        )
+
+UVI_FORECAST_ROW = schema(
+        ('uv', float, 'value'),
+        )
+
+ONECALL_CURRENT = schema(
+        ('dt', int, 'dt'),
+        ('temp', float, 'temp'),
+        ('humidity', float, 'humidity'),
+        ('pressure', float, 'pressure'),
+        ('speed', float, 'wind_speed'),
+        ('gust', float, 'wind_gust'),
+        ('winddir', float, 'wind_deg'),
+        ('visibility', float, 'visibility'),
+        ('rain', float, 'rain.1h', 0.0),
+        ('snow', float, 'snow.1h', 0.0),
+        ('rain_1h', float, 'rain.1h', 0.0),
+        ('snow_1h', float, 'snow.1h', 0.0),
+        ('clouds', float, 'clouds'),
+        ('weather', int, 'weather.0.id'),
+        ('uv', float, 'uvi'),
+        )
+
+ONECALL_DAILY_ROW = schema(
+        ('dt', int, 'dt'),
+        ('temp_max', float, 'temp.max'),
+        ('temp_min', float, 'temp.min'),
+        ('humidity', float, 'humidity'),
+        ('pressure', float, 'pressure'),
+        ('speed', float, 'wind_speed'),
+        ('winddir', float, 'wind_deg', 0.0),
+        ('clouds', float, 'clouds', 0.0),
+        ('rain', float, 'rain', 0.0),
+        ('snow', float, 'snow', 0.0),
+        ('weather', int, 'weather.0.id', 0),
+        ('uv', float, 'uvi', 0.0),
+        )
+
+ONECALL_HOURLY_ROW = schema(
+        ('dt', int, 'dt'),
+        ('temp', float, 'temp'),
+        ('humidity', float, 'humidity'),
+        ('pressure', float, 'pressure'),
+        ('speed', float, 'wind_speed'),
+        ('winddir', float, 'wind_deg', 0.0),
+        ('clouds', float, 'clouds', 0.0),
+        ('weather', int, 'weather.0.id', 0),
+        ('pop', float, 'pop', 0.0),
+        ('rain', float, 'rain.1h', 0.0),
+        ('snow', float, 'snow.1h', 0.0),
+        )
+
+
+# A flat record with the schema's fields
+def record(data, fields):
+    if not isinstance(data, dict):
+        raise ValueError('Expected an object, got ' + type(data).__name__)
+    out = {}
+    for f in fields:
+        value = f.lookup(data)
+        if value is None:
+            value = f.default
+            if value is None:
+                continue
+        out[f.name] = f.kind(value)
+    return out
+
+
+# The rows projected into one list per field.  Each column is filled in
+# a single pass over the rows.
+def columns(rows, fields):
+    if not isinstance(rows, list):
+        raise ValueError('Expected a list, got ' + type(rows).__name__)
+    out = {}
+    for f in fields:
+        kind = f.kind
+        column = []
+        if len(f.getters) == 1:
+            get = f.getters[0]
+            for row in rows:
+                try:
+                    column.append(kind(get(row)))
+                except (KeyError, IndexError, TypeError, AttributeError):
+                    column.append(missing(f, row))
+        else:
+            for row in rows:
+                column.append(missing(f, row))
+        out[f.name] = column
+    return out
+
+
+def missing(field, row):
+    value = field.lookup(row)
+    if value is None:
+        value = field.default
+        if value is None:
+            raise ValueError('Forecast row without ' + field.name)
+    return field.kind(value)
+
+
+def project_weather(jdata):
+    return record(jdata, WEATHER)
+
+
+def project_uvi(jdata):
+    return record(jdata, UVI)
+
+
+def project_forecast(jdata):
+    if not isinstance(jdata, dict) or 'list' not in jdata:
+        raise ValueError('Forecast without a list of rows')
+    return columns(jdata['list'], FORECAST_ROW)
+
+
+def project_uvi_forecast(jdata):
+    return columns(jdata, UVI_FORECAST_ROW)
+
+
+def project_onecall(jdata):
+    if not isinstance(jdata, dict) or 'current' not in jdata:
+        raise ValueError('One Call response without current conditions')
+    return {
+            'lat': float(jdata['lat']),
+            'lon': float(jdata['lon']),
+            'timezone_offset': int(jdata.get('timezone_offset', 0)),
+            'current': record(jdata['current'], ONECALL_CURRENT),
+            'daily': columns(jdata.get('daily', []), ONECALL_DAILY_ROW),
+            'hourly': columns(jdata.get('hourly', []), ONECALL_HOURLY_ROW),
+            }
+
+
+PROJECTIONS = {
+        'weather': project_weather,
+        'uvi': project_uvi,
+        'forecast': project_forecast,
+        'uvi/forecast': project_uvi_forecast,
+        'onecall': project_onecall,
+        }
+
+
+# Project the decoded response from the endpoint (extra)
+def project(extra, jdata):
+    try:
+        return PROJECTIONS[extra](jdata)
+    except (TypeError, KeyError) as e:
+        raise ValueError('Unexpected %s response: %s' % (extra, e))
@@ -0,0 +1,298 @@
+#
+#  Retry, back-off and circuit breaking for the API requests
+#
+#  Every request is classified by how it failed:
+#     transient  - timeouts, connection errors, 5xx responses and bodies
+#                  that are truncated or aren't JSON.  These are retried
+#                  with exponential back-off and full jitter.
+#     rate limit - 429 responses.  Retried after the Retry-After time if
+#                  that's short, otherwise all requests are held until
+#                  then.
+#     fatal      - anything else, like a bad API key (401) or an unknown
+#                  location (404), or a request that can't be made (bad
+#                  URL, redirect loop).  Never retried.
+#  Request errors not listed in FATAL_REQUEST_ERRORS are transient.
+#
+#  Each endpoint has its own circuit breaker.  After enough consecutive
+#  transient failures the breaker opens and requests to that endpoint
+#  fail immediately instead of waiting on a server that is down.  After
+#  the reset timeout one trial request is let through (half open); if it
+#  succeeds the breaker closes, otherwise it opens again for twice as
+#  long.
+#
+#  usage:
+#     guard = Resilience()
+#     jdata = guard.call('weather', lambda: session.get(url))
+#     guard.status()   # STATUS_* for the node status driver
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import random
+import threading
+import time
+import requests
+from nodes import metrics
+from nodes import jsondecode
+
+LOGGER = polyinterface.LOGGER
+
+# Values of the API status driver, worst last
+STATUS_OK = 0
+STATUS_ERRORS = 1       # recent requests failed
+STATUS_DEGRADED = 2     # a breaker is half open
+STATUS_DOWN = 3         # a breaker is open
+STATUS_RATE_LIMITED = 4
+STATUS_UNAUTHORIZED = 5
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half open'
+
+# Request errors that retrying won't fix
+FATAL_REQUEST_ERRORS = (
+        requests.exceptions.URLRequired,
+        requests.exceptions.MissingSchema,
+        requests.exceptions.InvalidSchema,
+        requests.exceptions.InvalidURL,
+        requests.exceptions.InvalidHeader,
+        requests.exceptions.TooManyRedirects,
+        )
+
+
+class FetchError(Exception):
+    def __init__(self, message, status=None):
+        super(FetchError, self).__init__(message)
+        self.status = status
+
+
+class TransientError(FetchError):
+    pass
+
+
+class FatalError(FetchError):
+    pass
+
+
+class RateLimited(FetchError):
+    def __init__(self, message, retry_after):
+        super(RateLimited, self).__init__(message, 429)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(FetchError):
+    pass
+
+
+# Check the response status and decode the body
+def decode(response):
+    code = response.status_code
+    if code == 429:
+        raise RateLimited('Rate limited (429)', retry_after(response))
+    if code >= 500:
+        raise TransientError('Server error (' + str(code) + ')', code)
+    if code >= 400:
+        message = str(code)
+        try:
+            message += ' ' + str(jsondecode.loads(response.content).get('message'))
+        except:
+            pass
+        raise FatalError('Request failed: ' + message, code)
+
+    try:
+        with metrics.DECODE_SECONDS.time():
+            return jsondecode.loads(response.content)
+    except ValueError as e:
+        raise TransientError('Bad response body: ' + str(e), code)
+
+
+def retry_after(response, default=60.0):
+    try:
+        return max(float(response.headers.get('Retry-After')), 0.0)
+    except:
+        return default
+
+
+class CircuitBreaker:
+    def __init__(self, name, threshold=5, reset_timeout=30.0, max_timeout=600.0):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.max_timeout = max_timeout
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.timeout = reset_timeout
+        self.opened = 0.0
+        self.trial = False
+
+    # Returns the state a request may be made in now, None if it may
+    # not.  A request allowed while half open is the trial and must end
+    # with success(), failure() or release().
+    def allow(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return CLOSED
+            if self.state == OPEN:
+                if time.monotonic() - self.opened < self.timeout:
+                    return None
+                self.state = HALF_OPEN
+                self.trial = False
+            # half open, only a single trial request at a time
+            if self.trial:
+                return None
+            self.trial = True
+            return HALF_OPEN
+
+    def success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                LOGGER.info('Circuit breaker for ' + self.name + ' closed')
+            self.state = CLOSED
+            self.failures = 0
+            self.timeout = self.reset_timeout
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self.timeout = min(self.timeout * 2, self.max_timeout)
+                self._open()
+            elif self.state == CLOSED and self.failures >= self.threshold:
+                self._open()
+
+    # The request didn't tell us anything about the endpoint's health
+    def release(self):
+        with self.lock:
+            self.trial = False
+
+    def _open(self):
+        LOGGER.warning('Circuit breaker for ' + self.name + ' open for ' + str(int(self.timeout)) + ' seconds')
+        self.state = OPEN
+        self.opened = time.monotonic()
+        self.trial = False
+
+
+class Resilience:
+    def __init__(self, attempts=3, base_delay=0.5, max_delay=8.0,
+            max_retry_after=10.0, threshold=5, reset_timeout=30.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.breakers = {}
+        self.hold_until = 0.0
+        self.last_status = STATUS_OK
+        self.retries = 0
+        self.short_circuited = 0
+
+    def breaker(self, endpoint):
+        with self.lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(endpoint,
+                        self.threshold, self.reset_timeout)
+            return self.breakers[endpoint]
+
+    # full jitter, a random delay up to the exponential back-off
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    # Run request() and return the decoded response, retrying transient
+    # failures.  request is called once per attempt and returns a
+    # requests.Response.
+    def call(self, endpoint, request):
+        breaker = self.breaker(endpoint)
+        attempt = 0
+        while True:
+            wait = self.hold_until - time.monotonic()
+            if wait > 0:
+                self.count_short_circuit()
+                raise RateLimited('Rate limited for another ' + str(int(wait)) + ' seconds', wait)
+            state = breaker.allow()
+            if state is None:
+                self.count_short_circuit()
+                raise CircuitOpen('Circuit breaker for ' + endpoint + ' is open')
+
+            try:
+                try:
+                    response = request()
+                    try:
+                        jdata = decode(response)
+                    finally:
+                        response.close()
+                except FATAL_REQUEST_ERRORS as e:
+                    error = FatalError(type(e).__name__ + ': ' + str(e))
+                except requests.exceptions.RequestException as e:
+                    error = TransientError(type(e).__name__ + ': ' + str(e))
+                except (RateLimited, TransientError, FatalError) as e:
+                    error = e
+                else:
+                    breaker.success()
+                    self.set_status(STATUS_OK)
+                    return jdata
+
+                attempt += 1
+                if isinstance(error, FatalError):
+                    self.set_status(STATUS_UNAUTHORIZED if error.status == 401 else self.last_status)
+                    raise error
+                elif isinstance(error, RateLimited):
+                    if error.retry_after > self.max_retry_after or attempt >= self.attempts:
+                        with self.lock:
+                            self.hold_until = max(self.hold_until, time.monotonic() + error.retry_after)
+                        self.set_status(STATUS_RATE_LIMITED)
+                        raise error
+                    delay = error.retry_after
+                else:
+                    breaker.failure()
+                    self.set_status(STATUS_ERRORS)
+                    if attempt >= self.attempts or breaker.state != CLOSED:
+                        raise error
+                    delay = self.backoff(attempt - 1)
+            finally:
+                # a trial that didn't succeed or fail (fatal and rate
+                # limited responses, unexpected exceptions) mustn't keep
+                # the breaker half open forever
+                if state == HALF_OPEN:
+                    breaker.release()
+
+            LOGGER.debug('Retrying ' + endpoint + ' in %.1f seconds: %s' % (delay, str(error)))
+            with self.lock:
+                self.retries += 1
+            time.sleep(delay)
+
+    def count_short_circuit(self):
+        with self.lock:
+            self.short_circuited += 1
+
+    def set_status(self, status):
+        with self.lock:
+            self.last_status = status
+
+    # Overall API status for the node status driver, the worst of the
+    # breaker states and the last request result.
+    def status(self):
+        with self.lock:
+            status = self.last_status
+            breakers = list(self.breakers.values())
+            if self.hold_until > time.monotonic():
+                status = max(status, STATUS_RATE_LIMITED)
+        for b in breakers:
+            if b.state == OPEN:
+                status = max(status, STATUS_DOWN)
+            elif b.state == HALF_OPEN:
+                status = max(status, STATUS_DEGRADED)
+        return status
+
+    def stats(self):
+        with self.lock:
+            breakers = dict((name, b.state) for (name, b) in self.breakers.items())
+            return {
+                    'retries': self.retries,
+                    'short_circuited': self.short_circuited,
+                    'breakers': breakers,
+                    }
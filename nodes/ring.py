@@ -0,0 +1,114 @@
+#
+#  Fixed size ring buffer for the hourly forecast slots
+#
+#  Slot 0 is the forecast period that starts next, slot 1 the one after
+#  it and so on.  Each field is kept in its own array of floats and the
+#  slots are stored by time: when a new forecast starts later than the
+#  last one, the head moves forward over the periods that are over and
+#  nothing else is moved or reallocated.
+#
+#  update() loads the new forecast columns and returns the slots whose
+#  values changed, so only those have to be published.  When the head
+#  moved every slot shows a different period and all of them are
+#  returned.
+#
+#  usage:
+#     ring = ForecastRing(8, ('temp', 'rain'))
+#     changed = ring.update({'dt': [...], 'temp': [...], 'rain': [...]})
+#     for position in changed:
+#         slot = ring.slot(position)   # {'dt': .., 'temp': .., 'rain': ..} or None
+
+import array
+
+
+class ForecastRing:
+    def __init__(self, size, fields):
+        self.size = size
+        self.fields = tuple(fields)
+        self.times = array.array('q', [0] * size)
+        self.columns = dict((f, array.array('d', [0.0] * size)) for f in self.fields)
+        self.head = 0
+        self.base = None        # start of the period in slot 0
+        self.step = None        # length of a period in seconds
+
+    def clear(self):
+        for p in range(self.size):
+            self.times[p] = 0
+            for f in self.fields:
+                self.columns[f][p] = 0.0
+        self.head = 0
+        self.base = None
+
+    # Move slot 0 forward to the period starting at dt.  Returns False if
+    # the buffer had to be cleared instead.
+    def slide(self, dt):
+        if self.base is None or self.step is None:
+            return False
+        if dt < self.base or (dt - self.base) % self.step != 0:
+            return False
+        k = (dt - self.base) // self.step
+        if k >= self.size:
+            return False
+        for i in range(k):
+            p = (self.head + i) % self.size
+            self.times[p] = 0
+            for f in self.fields:
+                self.columns[f][p] = 0.0
+        self.head = (self.head + k) % self.size
+        self.base = dt
+        return True
+
+    # Load the forecast columns (with a 'dt' column of period start
+    # times) and return the list of slots that changed.
+    def update(self, columns):
+        dts = columns['dt']
+        if len(dts) == 0:
+            return []
+
+        step = dts[1] - dts[0] if len(dts) > 1 else self.step
+        moved = dts[0] != self.base
+        if step != self.step or not self.slide(dts[0]):
+            self.clear()
+            self.step = step
+            self.base = dts[0]
+
+        changed = set()
+        covered = 0
+        for (i, dt) in enumerate(dts):
+            if self.step is None or (dt - self.base) % self.step != 0:
+                continue
+            position = (dt - self.base) // self.step
+            if position >= self.size:
+                break
+            covered = max(covered, position + 1)
+            p = (self.head + position) % self.size
+            if self.times[p] != dt:
+                self.times[p] = dt
+                changed.add(position)
+            for f in self.fields:
+                value = columns[f][i]
+                column = self.columns[f]
+                if column[p] != value:
+                    column[p] = value
+                    changed.add(position)
+
+        # slots past the end of the new forecast
+        for position in range(covered, self.size):
+            p = (self.head + position) % self.size
+            if self.times[p] != 0:
+                self.times[p] = 0
+                changed.add(position)
+
+        if moved:
+            return list(range(self.size))
+        return sorted(changed)
+
+    # The values in the slot, None if the forecast doesn't cover it
+    def slot(self, position):
+        p = (self.head + position) % self.size
+        if self.times[p] == 0:
+            return None
+        values = {'dt': self.times[p]}
+        for f in self.fields:
+            values[f] = self.columns[f][p]
+        return values
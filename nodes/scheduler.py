@@ -0,0 +1,264 @@
+#
+#  Fetch scheduling for multiple locations
+#
+#  TokenBucket limits the rate of API calls to what the OpenWeatherMap
+#  plan allows.  Every HTTP request takes a token, tokens are refilled
+#  continuously at calls_per_minute / 60 per second, and callers block
+#  until a token is available.
+#
+#  FetchScheduler runs queued jobs on a single worker thread.  Instead
+#  of running every location's query at the start of a poll, the jobs
+#  are spread evenly across the poll interval so the requests don't
+#  arrive at the API in bursts.
+#
+#  Cadence learns how often a location's observations actually change.
+#  The weather query returns the observation time (dt), which usually
+#  only advances every 10 to 20 minutes.  Each response's dt is fed to
+#  observe() and next_delay() returns how long to wait before the next
+#  query: just after the next expected update when the data is fresh,
+#  backing off exponentially while it isn't, and always between the
+#  minimum and maximum intervals.
+#
+#  usage:
+#     bucket = TokenBucket(60)
+#     scheduler = FetchScheduler()
+#     scheduler.spread([('conditions_0', job0), ('conditions_1', job1)], 300)
+#     cadence = Cadence(60, 1200)
+#     cadence.observe(jdata['dt'])
+#     scheduler.submit('conditions_0', job0, cadence.next_delay())
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import heapq
+import itertools
+import threading
+import time
+
+LOGGER = polyinterface.LOGGER
+
+
+class TokenBucket:
+    def __init__(self, calls_per_minute, burst=None):
+        self.lock = threading.Lock()
+        self.tokens = 0.0
+        self.stamp = time.monotonic()
+        self.waits = 0
+        self.set_rate(calls_per_minute, burst)
+        self.tokens = float(self.burst)
+
+    def set_rate(self, calls_per_minute, burst=None):
+        with self.lock:
+            self.rate = max(float(calls_per_minute), 1.0) / 60.0
+            if burst is None:
+                # Allow a full refresh of one location to go out at once
+                burst = min(max(int(calls_per_minute) // 10, 4), int(calls_per_minute))
+            self.burst = max(int(burst), 1)
+            self.tokens = min(self.tokens, float(self.burst))
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(float(self.burst), self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    # Take a token, waiting for one if necessary.  Returns False if no
+    # token became available within the timeout.
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waited = False
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    if waited:
+                        self.waits += 1
+                    return True
+                delay = (1.0 - self.tokens) / self.rate
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                delay = min(delay, remaining)
+            waited = True
+            time.sleep(delay)
+
+
+class FetchScheduler:
+    def __init__(self):
+        self.queue = []
+        self.pending = {}
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.current = None
+
+    def start(self):
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name='owm-scheduler')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            if not self.running:
+                return
+            self.running = False
+            self.queue = []
+            self.pending = {}
+            self.cond.notify_all()
+        self.thread.join(5)
+        self.thread = None
+
+    # Queue a job to run after delay seconds.  A job with the same key
+    # that is still waiting to run is replaced rather than queued twice,
+    # so a slow cycle can't build up a backlog of the same queries.
+    def submit(self, key, job, delay=0):
+        self.start()
+        with self.cond:
+            seq = next(self.counter)
+            due = time.monotonic() + delay
+            if key in self.pending:
+                due = min(due, self.pending[key][0])
+            self.pending[key] = (due, seq)
+            heapq.heappush(self.queue, (due, seq, key, job))
+            self.cond.notify()
+
+    # Spread a list of (key, job) tuples evenly over the interval.
+    def spread(self, jobs, interval):
+        if len(jobs) == 0:
+            return
+        step = float(interval) / len(jobs)
+        for (i, (key, job)) in enumerate(jobs):
+            self.submit(key, job, i * step)
+
+    def backlog(self):
+        with self.cond:
+            return len(self.pending)
+
+    # True if the job is waiting to run or is running now
+    def is_pending(self, key):
+        with self.cond:
+            return key in self.pending or key == self.current
+
+    def _next_job(self):
+        with self.cond:
+            while self.running:
+                if len(self.queue) == 0:
+                    self.cond.wait()
+                    continue
+
+                (due, seq, key, job) = self.queue[0]
+                if self.pending.get(key, (None, None))[1] != seq:
+                    # replaced by a later submit
+                    heapq.heappop(self.queue)
+                    continue
+
+                now = time.monotonic()
+                if due > now:
+                    self.cond.wait(due - now)
+                    continue
+
+                heapq.heappop(self.queue)
+                del self.pending[key]
+                self.current = key
+                return (key, job)
+        return (None, None)
+
+    def _run(self):
+        while True:
+            (key, job) = self._next_job()
+            if job is None:
+                return
+            try:
+                job()
+            except Exception as e:
+                LOGGER.error('Scheduled job ' + str(key) + ' failed: ' + str(e))
+            finally:
+                with self.cond:
+                    self.current = None
+
+
+class Cadence:
+    # weight of each new sample in the learned period and lag
+    ALPHA = 0.3
+    # how long after the expected update to query
+    MARGIN = 15
+
+    def __init__(self, min_interval, max_interval, default=300):
+        self.default = default
+        self.period = None      # seconds between observation times
+        self.lag = 0.0          # seconds from observation time until it's seen
+        self.last_dt = None
+        self.stale = 0          # queries since dt last advanced
+        self.seen = 0           # number of observe() calls
+        self.set_limits(min_interval, max_interval)
+
+    def set_limits(self, min_interval, max_interval):
+        self.min_interval = max(float(min_interval), 1.0)
+        self.max_interval = max(float(max_interval), self.min_interval)
+
+    # Record the observation time from a query, None if the query
+    # failed.  Returns True if the observation is new.
+    def observe(self, dt, now=None):
+        if now is None:
+            now = time.time()
+        self.seen += 1
+
+        if dt is None or (self.last_dt is not None and dt <= self.last_dt):
+            self.stale += 1
+            return False
+
+        lag = max(now - dt, 0.0)
+        if self.last_dt is None:
+            self.lag = lag
+        else:
+            step = float(dt - self.last_dt)
+            if self.period is not None and step > 1.5 * self.period:
+                # missed one or more updates in between
+                step /= round(step / self.period)
+            if self.period is None:
+                self.period = step
+            else:
+                self.period += self.ALPHA * (step - self.period)
+
+            # Only a query that was waiting for the update tells us when
+            # it appeared.  Otherwise it may have appeared earlier, so
+            # try a little earlier next time.
+            if self.stale > 0:
+                self.lag = lag
+            else:
+                self.lag = max(min(lag, self.lag) - self.MARGIN, 0.0)
+
+        self.last_dt = dt
+        self.stale = 0
+        return True
+
+    # Record a query whose data has no observation time, One Call's
+    # current.dt is the time of the request.  Nothing is learned from it
+    # and the next query is made after the default interval.
+    def skip(self):
+        self.seen += 1
+        self.period = None
+        self.last_dt = None
+        self.stale = 0
+
+    # Seconds until the next query should be made
+    def next_delay(self, now=None):
+        if now is None:
+            now = time.time()
+
+        if self.period is None:
+            delay = self.default
+        elif self.stale == 0:
+            delay = self.last_dt + self.period + self.lag + self.MARGIN - now
+        else:
+            delay = self.min_interval * (2 ** (self.stale - 1))
+
+        return min(max(delay, self.min_interval), self.max_interval)
@@ -0,0 +1,122 @@
+#
+#  Last known good data for each location
+#
+#  Every valid set of responses for a location is saved here when it is
+#  published.  When a later query fails the nodes keep (and republish)
+#  the last good data, and the Data Age driver reports how old it is,
+#  so nothing waits on the network to answer a query.
+#
+#  kind is 'conditions' (weather, uvi), 'forecast' (the daily records)
+#  or 'coordinates' (latitude, longitude).
+#
+#  The store is saved to disk periodically (every shortPoll and longPoll)
+#  and when the node server stops, if it changed, and loaded again when
+#  the node server starts, so the nodes can be published right away
+#  instead of waiting for the first queries.  The data is saved as
+#  compact JSON, tuples come back as lists.  meta describes what the
+#  data depends on (the units), a file saved with different meta isn't
+#  loaded.
+#
+#  usage:
+#     store = SnapshotStore()
+#     store.put('zip=94040', 'conditions', (jdata, uv_data))
+#     (data, stamp) = store.get('zip=94040', 'conditions')
+#     store.save('snapshot.json', {'units': 'imperial'})
+#     store.load('snapshot.json', {'units': 'imperial'})
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import json
+import os
+import threading
+import time
+
+LOGGER = polyinterface.LOGGER
+
+VERSION = 1
+
+
+class SnapshotStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.snapshots = {}
+        self.dirty = False
+
+    def put(self, location, kind, data, stamp=None):
+        if stamp is None:
+            stamp = time.time()
+        with self.lock:
+            self.snapshots[(location, kind)] = (data, stamp)
+            self.dirty = True
+
+    # Returns (data, stamp) or None if there is no snapshot
+    def get(self, location, kind):
+        with self.lock:
+            return self.snapshots.get((location, kind))
+
+    # Seconds since the snapshot was saved, None if there is none
+    def age(self, location, kind, now=None):
+        snapshot = self.get(location, kind)
+        if snapshot is None:
+            return None
+        if now is None:
+            now = time.time()
+        return max(now - snapshot[1], 0.0)
+
+    # Remove snapshots for locations that are no longer configured
+    def retain(self, locations):
+        with self.lock:
+            for key in list(self.snapshots.keys()):
+                if key[0] not in locations:
+                    del self.snapshots[key]
+                    self.dirty = True
+
+    # Write the snapshots to path if they changed since the last save.
+    # Returns True if the file was written.
+    def save(self, path, meta=None):
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return False
+                entries = [[k[0], k[1], v[0], v[1]] for (k, v) in self.snapshots.items()]
+                self.dirty = False
+            try:
+                text = json.dumps({'version': VERSION, 'meta': meta, 'snapshots': entries},
+                        separators=(',', ':'))
+                tmp = path + '.tmp'
+                with open(tmp, 'w') as f:
+                    f.write(text)
+                os.replace(tmp, path)
+            except:
+                with self.lock:
+                    self.dirty = True
+                raise
+        return True
+
+    # Load the snapshots saved in path, snapshots already in the store
+    # are kept if they're newer.  Returns the number loaded.
+    def load(self, path, meta=None):
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            LOGGER.error('Failed to read snapshots from ' + path + ': ' + str(e))
+            return 0
+
+        if saved.get('version') != VERSION or saved.get('meta') != meta:
+            LOGGER.info('Not using the snapshots in ' + path + ', the configuration changed')
+            return 0
+
+        loaded = 0
+        with self.lock:
+            for (location, kind, data, stamp) in saved.get('snapshots', []):
+                current = self.snapshots.get((location, kind))
+                if current is None or current[1] < stamp:
+                    self.snapshots[(location, kind)] = (data, stamp)
+                    loaded += 1
+        return loaded
@@ -11,6 +11,31 @@
 #  condition driver types
 
 
+# Conversions from the metric units, (from uom, to uom) -> function.
+# OpenWeatherMap is always queried in metric and the values are
+# converted to the configured units when they are published.
+CONVERSIONS = {
+        (4, 17): lambda c: c * 1.8 + 32,            # C -> F
+        (49, 48): lambda ms: ms * 2.236936,         # m/s -> mph
+        (82, 105): lambda mm: mm / 25.4,            # mm -> inches
+        (46, 24): lambda mmh: mmh / 25.4,           # mm/hour -> inches/hour
+        (83, 116): lambda km: km * 0.6213712,       # km -> miles
+        (106, 120): lambda mmd: mmd / 25.4,         # mm/day -> inches/day
+        }
+
+
+# driver -> function converting the driver's metric value to the units
+# configuration, only for the drivers whose units differ from metric
+def get_converters(units):
+    metric = get_uom('metric')
+    target = get_uom(units)
+    converters = {}
+    for driver in target:
+        if target[driver] != metric[driver]:
+            converters[driver] = CONVERSIONS[(metric[driver], target[driver])]
+    return converters
+
+
 def get_uom(units):
     unit_cfg = units.lower()
 
@@ -45,6 +70,11 @@ def get_uom(units):
             'GV18': 22,     # chance of precipitation
             'GV19': 25,     # day of week
             'GV20': 106,    # ETo
+            'GV21': 25,     # API status
+            'GV22': 45,     # data age (minutes)
+            'GV23': 56,     # hour the forecast period starts
+            'GV24': 82,     # rain, last 7 days
+            'GV25': 82,     # ETo, last 7 days
         }
     elif unit_cfg == 'uk':
         uom = {
@@ -55,14 +85,14 @@ def get_uom(units):
             'WINDDIR': 76,  # direction
             'DEWPT': 4,     # dew point
             'SOLRAD': 74,   # solar radiation
-            'RAINRT': 24,   # rain rate
+            'RAINRT': 46,   # rain rate
             'GV0': 4,       # max temp
             'GV1': 4,       # min temp
             'GV2': 4,       # feels like
             'GV3': 4,       # ??feels like
             'GV4': 48,      # wind speed
             'GV5': 48,      # wind gusts
-            'GV6': 105,     # rain
+            'GV6': 82,      # rain
             'GV7': 82,      # snow
             'GV8': 82,      # snow depth
             'GV9': 56,      # moon phase
@@ -76,7 +106,12 @@ def get_uom(units):
             'GV17': 56,     # Air Quality
             'GV18': 22,     # chance of precipitation
             'GV19': 25,     # day of week
-            'GV20': 120,    # ETo
+            'GV20': 106,    # ETo
+            'GV21': 25,     # API status
+            'GV22': 45,     # data age (minutes)
+            'GV23': 56,     # hour the forecast period starts
+            'GV24': 82,     # rain, last 7 days
+            'GV25': 82,     # ETo, last 7 days
         }
     else:
         uom = {
@@ -109,6 +144,11 @@ def get_uom(units):
             'GV18': 22,     # chance of precipitation
             'GV19': 25,     # day of week
             'GV20': 120,    # ETo
+            'GV21': 25,     # API status
+            'GV22': 45,     # data age (minutes)
+            'GV23': 56,     # hour the forecast period starts
+            'GV24': 105,    # rain, last 7 days
+            'GV25': 105,    # ETo, last 7 days
         }
 
     return uom
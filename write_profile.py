@@ -1,140 +1,255 @@
 #!/usr/bin/env python3
+#
+#  Profile build
+#
+#  The node definitions are derived from the node classes' driver lists
+#  and the units of measure in nodes/uom.py, the editor for each driver
+#  is the one in profile/editor/editors.xml that covers all of the
+#  driver's units.  The profile (node definitions, editors, nls and
+#  version.txt) is rendered in memory and hashed, the files and
+#  profile.zip are only written when their content changed.  The hash of
+#  the last build is kept as the profile.zip comment.
+#
+#  write_profile() is called when the node server starts and returns True
+#  if the profile changed, so the profile is only installed on the ISY
+#  when it needs to be.  It can also be run stand-alone:
+#
+#     python3 write_profile.py            build the profile if it changed
+#     python3 write_profile.py --check    exit 1 if the profile is out of date
+#     python3 write_profile.py --force    rebuild profile.zip
 
 import collections
-import re
+import hashlib
 import os
+import xml.etree.ElementTree
 import zipfile
 import json
 
 pfx = "profile:"
 
+PROFILE_DIR = "profile"
+NODEDEF_FILE = "profile/nodedef/nodedef.xml"
+EDITOR_FILE = "profile/editor/editors.xml"
 VERSION_FILE = "profile/version.txt"
+ZIP_FILE = "profile.zip"
+
+# all unit configurations, a driver's editor has to cover each of them
+UNITS = ('metric', 'uk', 'imperial')
 
 # templates to make the string writes a bit easier to read
 NODEDEF_TMPL = "  <nodeDef id=\"%s\" nodeType=\"139\" nls=\"%s\">\n"
 STATUS_TMPL = "      <st id=\"%s\" editor=\"%s\" />\n"
+CMD_TMPL = "        <cmd id=\"%s\" />\n"
+PARAM_TMPL = "          <p id=\"%s\" editor=\"%s\" init=\"%s\" />\n"
 
-# unit of measure to editor mapping
-uom = {
-        4 : 'TEMP_C',
-        17 : 'TEMP_F',
-        2 : 'bool',
-        22 : 'PERCENT',
-        117 : 'MB',
-        48 : 'MPH',
-        49 : 'MPS',
-        76 : 'DEGREES',
-        105 : 'INCHES',
-        82 : 'MM',
-        36 : 'LUMIN',
-        56 : 'int',
-        38 : 'METERS',
-        27 : 'COVERAGE',
-        70 : 'INTENSITY',
-        25 : 'CONDITIONS',
-        118 : 'HPA',
-        23 : 'INHG',
-        71 : 'UV',
-        116 : 'MILES',
-        46 : 'mmhr',
-        24 : 'inhr',
-        9 : 'DAY',
-        106 : 'ET',
-        83 : 'KM',
-        }
-
+# index values (uom 25) share a uom so the editor has to be named
 index_editor = {
-        'GV19' : 'DAY',
         'GV13' : 'CONDITIONS',
+        'GV19' : 'DAY',
+        'GV21' : 'APISTATUS',
+        }
+
+# parameters of the commands that take one, (id, editor, init)
+command_params = {
+        'DEBUG' : [('', 'DEBUG', '30')],
         }
 
+# A node definition, uoms(driver) returns the set of units of measure
+# the driver can have and editors names the editor for drivers whose
+# units are covered by more than one editor.
+NodeDef = collections.namedtuple('NodeDef',
+        ['id', 'nls', 'drivers', 'uoms', 'accepts', 'editors'])
+
+
+def unit_uoms(driver):
+    from nodes import uom
+    return set(uom.get_uom(units)[driver] for units in UNITS)
+
+
+def node_defs():
+    from nodes import owm
+    from nodes import owm_conditions
+    from nodes import owm_daily
+    from nodes import owm_hourly
+    from nodes import owm_metrics
+
+    metrics = owm_metrics.MetricsNode
+    return [
+            NodeDef(owm.Controller.id, 'ctl',
+                [d['driver'] for d in owm.Controller.drivers],
+                unit_uoms, list(owm.Controller.commands), {}),
+            NodeDef(owm_conditions.ConditionsNode.id, 'ctl',
+                owm_conditions.ConditionsNode.driver_names,
+                unit_uoms, [], {}),
+            NodeDef(owm_daily.DailyNode.id, 'ctl',
+                owm_daily.DailyNode.driver_names,
+                unit_uoms, [], {}),
+            NodeDef(owm_hourly.HourlyNode.id, 'ctl',
+                owm_hourly.HourlyNode.driver_names,
+                unit_uoms, [], {'GV23': 'HOUR'}),
+            NodeDef(metrics.id, 'met', metrics.driver_names,
+                lambda driver: set([metrics.uom[driver]]), [],
+                {'GV0': 'COUNT', 'GV3': 'COUNT', 'GV4': 'COUNT'}),
+            ]
+
+
+# editor id -> set of the uoms it has a range for
+def read_editors(path=EDITOR_FILE):
+    editors = collections.OrderedDict()
+    for editor in xml.etree.ElementTree.parse(path).getroot().iter('editor'):
+        editors[editor.get('id')] = set(int(r.get('uom')) for r in editor.iter('range'))
+    return editors
+
+
+def find_editor(node, driver, editors):
+    if driver in node.editors:
+        return node.editors[driver]
+    if driver in index_editor:
+        return index_editor[driver]
+    uoms = node.uoms(driver)
+    matches = [e for e in editors if uoms <= editors[e]]
+    if len(matches) != 1:
+        raise ValueError('%s %s (uom %s) matches editors %s, name one' %
+                (node.id, driver, sorted(uoms), matches))
+    return matches[0]
+
+
+# Render the node definition file
+def render_nodedefs(nodes, editors):
+    out = ["<nodeDefs>\n"]
+    for node in nodes:
+        out.append(NODEDEF_TMPL % (node.id, node.nls))
+        out.append("    <editors />\n")
+        out.append("    <sts>\n")
+        for d in node.drivers:
+            out.append(STATUS_TMPL % (d, find_editor(node, d, editors)))
+        out.append("    </sts>\n")
+        out.append("    <cmds>\n")
+        out.append("      <sends />\n")
+        out.append("      <accepts>\n")
+        for cmd in node.accepts:
+            if cmd in command_params:
+                out.append("        <cmd id=\"%s\">\n" % cmd)
+                for p in command_params[cmd]:
+                    out.append(PARAM_TMPL % p)
+                out.append("        </cmd>\n")
+            else:
+                out.append(CMD_TMPL % cmd)
+        out.append("      </accepts>\n")
+        out.append("    </cmds>\n")
+        out.append("  </nodeDef>\n\n")
+    out.append("</nodeDefs>\n")
+    return ''.join(out)
+
+
+# The profile files, path -> content.  The generated files replace the
+# ones on disk, everything else (editors, nls) is used as it is.
+def render_profile(sd):
+    files = collections.OrderedDict()
+    for dirname, subdirs, filenames in os.walk(PROFILE_DIR):
+        # Ignore dirs starting with a dot, stupid .AppleDouble...
+        subdirs[:] = sorted(s for s in subdirs if not s.startswith('.'))
+        for filename in sorted(filenames):
+            if filename.endswith('.xml') or filename.endswith('txt'):
+                path = os.path.join(dirname, filename)
+                with open(path, 'rb') as f:
+                    files[path] = f.read()
+
+    files[NODEDEF_FILE] = render_nodedefs(node_defs(), read_editors()).encode('utf-8')
+    files[VERSION_FILE] = sd['profile_version'].encode('utf-8')
+    return files
+
+
+def profile_hash(files):
+    digest = hashlib.sha256()
+    for path in sorted(files):
+        digest.update(path.encode('utf-8') + b'\0')
+        digest.update(files[path] + b'\0')
+    return 'sha256:' + digest.hexdigest()
+
+
+# Hash of the profile in profile.zip, None if there isn't one
+def built_hash():
+    try:
+        with zipfile.ZipFile(ZIP_FILE) as zf:
+            return zf.comment.decode('utf-8')
+    except (OSError, zipfile.BadZipFile):
+        return None
 
-# Create a node definition file.
-# 
-# We're assuming that we're just creating the definition for the controller
-# node and that to do that, we just iterate through the driver list to
-# build the status section of the node definition.
-def write_profile(logger, drivers, daily_drivers):
+
+def write_if_changed(logger, path, content):
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+
+    logger.info("{0} Writing {1}".format(pfx, path))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return True
+
+
+# The zip is built from the rendered files with fixed timestamps so the
+# same profile always gives the same zip file.
+def write_profile_zip(logger, files, digest):
+    logger.info("{0} Writing {1}".format(pfx, ZIP_FILE))
+    tmp = ZIP_FILE + '.tmp'
+    with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for path in sorted(files):
+            arcname = os.path.relpath(path, PROFILE_DIR)
+            info = zipfile.ZipInfo(arcname, date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            zf.writestr(info, files[path])
+        zf.comment = digest.encode('utf-8')
+    os.replace(tmp, ZIP_FILE)
+
+
+# Build the profile.  Returns True if any of the files or the zip
+# changed, False if the profile was already up to date or couldn't be
+# built.
+def write_profile(logger, force=False):
     sd = get_server_data(logger)
     if sd is False:
         logger.error("Unable to complete without server data...")
         return False
 
-    logger.info("{0} Writing profile/nodedef/nodedef.xml".format(pfx))
-    if not os.path.exists("profile/nodedef"):
+    try:
+        files = render_profile(sd)
+    except Exception as err:
+        logger.error('{0} failed to build the profile: {1}'.format(pfx, err), exc_info=True)
+        return False
+
+    digest = profile_hash(files)
+    changed = False
+    for path in (NODEDEF_FILE, VERSION_FILE):
+        changed = write_if_changed(logger, path, files[path]) or changed
+
+    if force or changed or built_hash() != digest:
+        write_profile_zip(logger, files, digest)
+        changed = True
+        logger.info("{0} done, {1}".format(pfx, digest))
+    else:
+        logger.debug("{0} profile is up to date, {1}".format(pfx, digest))
+    return changed
+
+
+# True if the profile files and zip match what would be built
+def profile_current(logger):
+    sd = get_server_data(logger)
+    if sd is False:
+        return False
+    files = render_profile(sd)
+    for path in (NODEDEF_FILE, VERSION_FILE):
         try:
-            os.makedirs("profile/nodedef")
-        except:
-            LOGGER.error('unable to create node definition directory.')
-
-    # Write the node definition file
-    nodedef = open("profile/nodedef/nodedef.xml", "w")
-    nodedef.write("<nodeDefs>\n")
-
-    nodedef.write(NODEDEF_TMPL % ('weather', 'ctl'))
-    nodedef.write("    <editors />\n")
-    nodedef.write("    <sts>\n")
-    for d in drivers:
-        if d['uom'] == 25:
-            nodedef.write(STATUS_TMPL % (d['driver'], index_editor[d['driver']]))
-        else:
-            nodedef.write(STATUS_TMPL % (d['driver'], uom[d['uom']]))
-    nodedef.write("    </sts>\n")
-    nodedef.write("    <cmds>\n")
-    nodedef.write("      <sends />\n")
-    nodedef.write("      <accepts>\n")
-    nodedef.write("        <cmd id=\"DISCOVER\" />\n")
-    nodedef.write("        <cmd id=\"REMOVE_NOTICES_ALL\" />\n")
-    nodedef.write("        <cmd id=\"UPDATE_PROFILE\" />\n")
-    nodedef.write("      </accepts>\n")
-    nodedef.write("    </cmds>\n")
-    nodedef.write("  </nodeDef>\n\n")
-
-    # Daily Forecast Node
-    nodedef.write(NODEDEF_TMPL % ('daily', 'ctl'))
-    nodedef.write("    <editors />\n")
-    nodedef.write("    <sts>\n")
-    for d in daily_drivers:
-        if d['uom'] == 25:
-            nodedef.write(STATUS_TMPL % (d['driver'], index_editor[d['driver']]))
-        else:
-            nodedef.write(STATUS_TMPL % (d['driver'], uom[d['uom']]))
-    nodedef.write("    </sts>\n")
-    nodedef.write("    <cmds>\n")
-    nodedef.write("      <sends />\n")
-    nodedef.write("      <accepts>\n")
-    nodedef.write("      </accepts>\n")
-    nodedef.write("    </cmds>\n")
-    nodedef.write("  </nodeDef>\n\n")
-    nodedef.write("</nodeDefs>")
-    nodedef.close()
-
-    # Update the profile version file with the info from server.json
-    with open(VERSION_FILE, 'w') as outfile:
-        outfile.write(sd['profile_version'])
-    outfile.close()
-
-    # Create the zip file that can be uploaded to the ISY
-    write_profile_zip(logger)
-
-    logger.info(pfx + " done.")
-
-
-def write_profile_zip(logger):
-    src = 'profile'
-    abs_src = os.path.abspath(src)
-    with zipfile.ZipFile('profile.zip', 'w') as zf:
-        for dirname, subdirs, files in os.walk(src):
-            # Ignore dirs starint with a dot, stupid .AppleDouble...
-            if not "/." in dirname:
-                for filename in files:
-                    if filename.endswith('.xml') or filename.endswith('txt'):
-                        absname = os.path.abspath(os.path.join(dirname, filename))
-                        arcname = absname[len(abs_src) + 1:]
-                        logger.info('write_profile_zip: %s as %s' %
-                                (os.path.join(dirname, filename), arcname))
-                        zf.write(absname, arcname)
-    zf.close()
+            with open(path, 'rb') as f:
+                if f.read() != files[path]:
+                    return False
+        except FileNotFoundError:
+            return False
+    return built_hash() == profile_hash(files)
 
 
 def get_server_data(logger):
@@ -158,7 +273,7 @@ def get_server_data(logger):
     v1 = 0;
     v2 = 0;
     if len(sv) == 1:
-        v1 = int(v1[0])
+        v1 = int(sv[0])
     elif len(sv) > 1:
         v1 = float("%s.%s" % (sv[0],str(sv[1])))
         if len(sv) == 3:
@@ -170,12 +285,23 @@ def get_server_data(logger):
     serverdata['version_minor'] = v2
     return serverdata
 
-# If we wanted to call this as a stand-alone script to generate the profile
-# files, we'd do something like what's below but we'd need some way to 
-# set the configuration.
 
 if __name__ == "__main__":
-    import logging,json
+    import argparse
+    import logging
+    import sys
+
+    parser = argparse.ArgumentParser(description='Build the node server profile')
+    parser.add_argument('--check', action='store_true',
+            help='only check, exit with 1 if the profile is out of date')
+    parser.add_argument('--force', action='store_true',
+            help='rebuild profile.zip even if nothing changed')
+    args = parser.parse_args()
+
+    # run from the node server directory, the paths are relative to it
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.getcwd())
+
     logger = logging.getLogger(__name__)
     logging.basicConfig(
         level=10,
@@ -183,24 +309,11 @@ if __name__ == "__main__":
     )
     logger.setLevel(logging.DEBUG)
 
-    # Test dictionaries to generate a custom nodedef file.
+    if args.check:
+        if profile_current(logger):
+            logger.info('{0} profile is up to date'.format(pfx))
+            sys.exit(0)
+        logger.info('{0} profile is out of date'.format(pfx))
+        sys.exit(1)
 
-    # Only write the profile if the version is updated.
-    sd = get_server_data(logger)
-    if sd is not False:
-        local_version = None
-        try:
-            with open(VERSION_FILE,'r') as vfile:
-                local_version = vfile.readline()
-                local_version = local_version.rstrip()
-                vfile.close()
-        except (FileNotFoundError):
-            pass
-        except (Exception) as err:
-            logger.error('{0} failed to read local version from {1}: {2}'.format(pfx,VERSION_FILE,err), exc_info=True)
-
-        if local_version == sd['profile_version']:
-            logger.info('{0} Not Generating new profile since local version {1} is the same current {2}'.format(pfx,local_version,sd['profile_version']))
-        else:
-            logger.info('{0} Generating new profile since local version {1} is not current {2}'.format(pfx,local_version,sd['profile_version']))
-            #write_profile(logger, [])
+    write_profile(logger, args.force)